@@ -5,24 +5,138 @@ d = { 'settings': { 'branch': 'main',
                 'doc_host': 'https://drscotthawley.github.io',
                 'git_url': 'https://github.com/drscotthawley/aeiou/',
                 'lib_path': 'aeiou'},
-  'syms': { 'aeiou.chunkadelic': { 'aeiou.chunkadelic.blow_chunks': ('chunkadelic.html#blow_chunks', 'aeiou/chunkadelic.py'),
+  'syms': { 'aeiou.chunkadelic': { 'aeiou.chunkadelic.BackgroundSaver': ('chunkadelic.html#backgroundsaver', 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.BackgroundSaver.__init__': ( 'chunkadelic.html#backgroundsaver.__init__',
+                                                                                   'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.BackgroundSaver.submit': ( 'chunkadelic.html#backgroundsaver.submit',
+                                                                                 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.BackgroundSaver.wait': ( 'chunkadelic.html#backgroundsaver.wait',
+                                                                               'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.ShardWriter': ('chunkadelic.html#shardwriter', 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.ShardWriter.__init__': ( 'chunkadelic.html#shardwriter.__init__',
+                                                                               'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.ShardWriter.add': ('chunkadelic.html#shardwriter.add', 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.ShardWriter.claim_shard': ( 'chunkadelic.html#shardwriter.claim_shard',
+                                                                                  'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.ShardWriter.close': ('chunkadelic.html#shardwriter.close', 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.ShardWriter.write': ('chunkadelic.html#shardwriter.write', 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.blow_chunks': ('chunkadelic.html#blow_chunks', 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.chunk_filenames': ('chunkadelic.html#chunk_filenames', 'aeiou/chunkadelic.py'),
                                    'aeiou.chunkadelic.chunk_one_file': ('chunkadelic.html#chunk_one_file', 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.drop_from_shards': ('chunkadelic.html#drop_from_shards', 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.finish_shards': ('chunkadelic.html#finish_shards', 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.get_saver': ('chunkadelic.html#get_saver', 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.get_shard_writer': ('chunkadelic.html#get_shard_writer', 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.load_chunk_manifest': ( 'chunkadelic.html#load_chunk_manifest',
+                                                                              'aeiou/chunkadelic.py'),
                                    'aeiou.chunkadelic.main': ('chunkadelic.html#main', 'aeiou/chunkadelic.py'),
-                                   'aeiou.chunkadelic.set_bit_rate': ('chunkadelic.html#set_bit_rate', 'aeiou/chunkadelic.py')},
-            'aeiou.core': { 'aeiou.core.audio_float_to_int': ('core.html#audio_float_to_int', 'aeiou/core.py'),
+                                   'aeiou.chunkadelic.merge_shards': ('chunkadelic.html#merge_shards', 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.needs_chunking': ('chunkadelic.html#needs_chunking', 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.params_hash': ('chunkadelic.html#params_hash', 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.save_chunk': ('chunkadelic.html#save_chunk', 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.save_chunks': ('chunkadelic.html#save_chunks', 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.set_bit_rate': ('chunkadelic.html#set_bit_rate', 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.stream_chunks': ('chunkadelic.html#stream_chunks', 'aeiou/chunkadelic.py'),
+                                   'aeiou.chunkadelic.write_chunk_manifest': ( 'chunkadelic.html#write_chunk_manifest',
+                                                                               'aeiou/chunkadelic.py')},
+            'aeiou.core': { 'aeiou.core.AudioCache': ('core.html#audiocache', 'aeiou/core.py'),
+                            'aeiou.core.AudioCache.__call__': ('core.html#audiocache.__call__', 'aeiou/core.py'),
+                            'aeiou.core.AudioCache.__init__': ('core.html#audiocache.__init__', 'aeiou/core.py'),
+                            'aeiou.core.AudioCache._entries': ('core.html#audiocache._entries', 'aeiou/core.py'),
+                            'aeiou.core.AudioCache.cache_file': ('core.html#audiocache.cache_file', 'aeiou/core.py'),
+                            'aeiou.core.AudioCache.evict': ('core.html#audiocache.evict', 'aeiou/core.py'),
+                            'aeiou.core.AudioCache.key': ('core.html#audiocache.key', 'aeiou/core.py'),
+                            'aeiou.core.PackedCorpus': ('core.html#packedcorpus', 'aeiou/core.py'),
+                            'aeiou.core.PackedCorpus.__getitem__': ('core.html#packedcorpus.__getitem__', 'aeiou/core.py'),
+                            'aeiou.core.PackedCorpus.__getstate__': ('core.html#packedcorpus.__getstate__', 'aeiou/core.py'),
+                            'aeiou.core.PackedCorpus.__init__': ('core.html#packedcorpus.__init__', 'aeiou/core.py'),
+                            'aeiou.core.PackedCorpus.__len__': ('core.html#packedcorpus.__len__', 'aeiou/core.py'),
+                            'aeiou.core.PackedCorpus.data': ('core.html#packedcorpus.data', 'aeiou/core.py'),
+                            'aeiou.core.PipelineReport': ('core.html#pipelinereport', 'aeiou/core.py'),
+                            'aeiou.core.PipelineReport.__init__': ('core.html#pipelinereport.__init__', 'aeiou/core.py'),
+                            'aeiou.core.PipelineReport.add': ('core.html#pipelinereport.add', 'aeiou/core.py'),
+                            'aeiou.core.PipelineReport.add_file': ('core.html#pipelinereport.add_file', 'aeiou/core.py'),
+                            'aeiou.core.PipelineReport.add_stages': ('core.html#pipelinereport.add_stages', 'aeiou/core.py'),
+                            'aeiou.core.PipelineReport.from_dict': ('core.html#pipelinereport.from_dict', 'aeiou/core.py'),
+                            'aeiou.core.PipelineReport.save': ('core.html#pipelinereport.save', 'aeiou/core.py'),
+                            'aeiou.core.PipelineReport.summary': ('core.html#pipelinereport.summary', 'aeiou/core.py'),
+                            'aeiou.core.PipelineReport.to_dict': ('core.html#pipelinereport.to_dict', 'aeiou/core.py'),
+                            'aeiou.core.StageStats': ('core.html#stagestats', 'aeiou/core.py'),
+                            'aeiou.core.StageStats.__init__': ('core.html#stagestats.__init__', 'aeiou/core.py'),
+                            'aeiou.core.StageStats.add': ('core.html#stagestats.add', 'aeiou/core.py'),
+                            'aeiou.core.StageStats.pop': ('core.html#stagestats.pop', 'aeiou/core.py'),
+                            'aeiou.core.StageStats.time': ('core.html#stagestats.time', 'aeiou/core.py'),
+                            'aeiou.core.StreamingResampler': ('core.html#streamingresampler', 'aeiou/core.py'),
+                            'aeiou.core.StreamingResampler.__call__': ('core.html#streamingresampler.__call__', 'aeiou/core.py'),
+                            'aeiou.core.StreamingResampler.__init__': ('core.html#streamingresampler.__init__', 'aeiou/core.py'),
+                            'aeiou.core.StreamingResampler._run': ('core.html#streamingresampler._run', 'aeiou/core.py'),
+                            'aeiou.core.StreamingResampler.flush': ('core.html#streamingresampler.flush', 'aeiou/core.py'),
+                            'aeiou.core.WorkerRuntime': ('core.html#workerruntime', 'aeiou/core.py'),
+                            'aeiou.core.WorkerRuntime.__init__': ('core.html#workerruntime.__init__', 'aeiou/core.py'),
+                            'aeiou.core.WorkerRuntime.__repr__': ('core.html#workerruntime.__repr__', 'aeiou/core.py'),
+                            'aeiou.core.WorkerRuntime.setup': ('core.html#workerruntime.setup', 'aeiou/core.py'),
+                            'aeiou.core.WorkerRuntime.worker_cpus': ('core.html#workerruntime.worker_cpus', 'aeiou/core.py'),
+                            'aeiou.core._call_worker': ('core.html#_call_worker', 'aeiou/core.py'),
+                            'aeiou.core._call_worker_batch': ('core.html#_call_worker_batch', 'aeiou/core.py'),
+                            'aeiou.core._ckpt_index_is_current': ('core.html#_ckpt_index_is_current', 'aeiou/core.py'),
+                            'aeiou.core._decode_for_pack': ('core.html#_decode_for_pack', 'aeiou/core.py'),
+                            'aeiou.core._decode_librosa': ('core.html#_decode_librosa', 'aeiou/core.py'),
+                            'aeiou.core._decode_pedalboard': ('core.html#_decode_pedalboard', 'aeiou/core.py'),
+                            'aeiou.core._decode_soundfile': ('core.html#_decode_soundfile', 'aeiou/core.py'),
+                            'aeiou.core._decode_torchaudio': ('core.html#_decode_torchaudio', 'aeiou/core.py'),
+                            'aeiou.core._init_worker': ('core.html#_init_worker', 'aeiou/core.py'),
+                            'aeiou.core._iter_decoded_blocks': ('core.html#_iter_decoded_blocks', 'aeiou/core.py'),
+                            'aeiou.core._probe_file': ('core.html#_probe_file', 'aeiou/core.py'),
+                            'aeiou.core._read_ckpt_index': ('core.html#_read_ckpt_index', 'aeiou/core.py'),
+                            'aeiou.core.audio_float_to_int': ('core.html#audio_float_to_int', 'aeiou/core.py'),
+                            'aeiou.core.available_cpus': ('core.html#available_cpus', 'aeiou/core.py'),
+                            'aeiou.core.balanced_shard': ('core.html#balanced_shard', 'aeiou/core.py'),
+                            'aeiou.core.batch_db': ('core.html#batch_db', 'aeiou/core.py'),
+                            'aeiou.core.batch_is_silence': ('core.html#batch_is_silence', 'aeiou/core.py'),
                             'aeiou.core.batch_it_crazy': ('core.html#batch_it_crazy', 'aeiou/core.py'),
+                            'aeiou.core.bench_decode_main': ('core.html#bench_decode_main', 'aeiou/core.py'),
+                            'aeiou.core.bench_decoders': ('core.html#bench_decoders', 'aeiou/core.py'),
+                            'aeiou.core.build_audio_index': ('core.html#build_audio_index', 'aeiou/core.py'),
                             'aeiou.core.fast_scandir': ('core.html#fast_scandir', 'aeiou/core.py'),
+                            'aeiou.core.find_ckpts': ('core.html#find_ckpts', 'aeiou/core.py'),
                             'aeiou.core.get_audio_filenames': ('core.html#get_audio_filenames', 'aeiou/core.py'),
+                            'aeiou.core.get_audio_index': ('core.html#get_audio_index', 'aeiou/core.py'),
+                            'aeiou.core.get_audio_info': ('core.html#get_audio_info', 'aeiou/core.py'),
                             'aeiou.core.get_dbmax': ('core.html#get_dbmax', 'aeiou/core.py'),
+                            'aeiou.core.get_decoder_prefs': ('core.html#get_decoder_prefs', 'aeiou/core.py'),
                             'aeiou.core.get_device': ('core.html#get_device', 'aeiou/core.py'),
                             'aeiou.core.get_latest_ckpt': ('core.html#get_latest_ckpt', 'aeiou/core.py'),
+                            'aeiou.core.get_resampler': ('core.html#get_resampler', 'aeiou/core.py'),
                             'aeiou.core.get_run_info': ('core.html#get_run_info', 'aeiou/core.py'),
+                            'aeiou.core.get_shared_audio_index': ('core.html#get_shared_audio_index', 'aeiou/core.py'),
+                            'aeiou.core.hash_shard': ('core.html#hash_shard', 'aeiou/core.py'),
+                            'aeiou.core.import_benchmark': ('core.html#import_benchmark', 'aeiou/core.py'),
+                            'aeiou.core.index_durations': ('core.html#index_durations', 'aeiou/core.py'),
                             'aeiou.core.is_silence': ('core.html#is_silence', 'aeiou/core.py'),
                             'aeiou.core.is_tool': ('core.html#is_tool', 'aeiou/core.py'),
+                            'aeiou.core.iter_audio_filenames': ('core.html#iter_audio_filenames', 'aeiou/core.py'),
+                            'aeiou.core.iter_scan_dirs': ('core.html#iter_scan_dirs', 'aeiou/core.py'),
+                            'aeiou.core.latest_indexed_ckpt': ('core.html#latest_indexed_ckpt', 'aeiou/core.py'),
                             'aeiou.core.load_audio': ('core.html#load_audio', 'aeiou/core.py'),
+                            'aeiou.core.load_audio_index': ('core.html#load_audio_index', 'aeiou/core.py'),
                             'aeiou.core.makedir': ('core.html#makedir', 'aeiou/core.py'),
+                            'aeiou.core.merge_report_files': ('core.html#merge_report_files', 'aeiou/core.py'),
+                            'aeiou.core.merge_reports': ('core.html#merge_reports', 'aeiou/core.py'),
                             'aeiou.core.normalize_audio': ('core.html#normalize_audio', 'aeiou/core.py'),
+                            'aeiou.core.pack_corpus': ('core.html#pack_corpus', 'aeiou/core.py'),
+                            'aeiou.core.packed_to_float': ('core.html#packed_to_float', 'aeiou/core.py'),
+                            'aeiou.core.register_ckpt': ('core.html#register_ckpt', 'aeiou/core.py'),
                             'aeiou.core.rnd_string': ('core.html#rnd_string', 'aeiou/core.py'),
+                            'aeiou.core.save_audio_index': ('core.html#save_audio_index', 'aeiou/core.py'),
+                            'aeiou.core.save_decoder_prefs': ('core.html#save_decoder_prefs', 'aeiou/core.py'),
+                            'aeiou.core.scan_dirs': ('core.html#scan_dirs', 'aeiou/core.py'),
+                            'aeiou.core.shard_filename': ('core.html#shard_filename', 'aeiou/core.py'),
+                            'aeiou.core.shard_files': ('core.html#shard_files', 'aeiou/core.py'),
+                            'aeiou.core.shard_spec': ('core.html#shard_spec', 'aeiou/core.py'),
+                            'aeiou.core.size_batches': ('core.html#size_batches', 'aeiou/core.py'),
+                            'aeiou.core.stream_audio': ('core.html#stream_audio', 'aeiou/core.py'),
+                            'aeiou.core.stream_map': ('core.html#stream_map', 'aeiou/core.py'),
+                            'aeiou.core.unbatch_it_crazy': ('core.html#unbatch_it_crazy', 'aeiou/core.py'),
                             'aeiou.core.untuple': ('core.html#untuple', 'aeiou/core.py')},
             'aeiou.datasets': { 'aeiou.datasets.AudioDataset': ('datasets.html#audiodataset', 'aeiou/datasets.py'),
                                 'aeiou.datasets.AudioDataset.__getitem__': ('datasets.html#audiodataset.__getitem__', 'aeiou/datasets.py'),
@@ -32,6 +146,7 @@ d = { 'settings': { 'branch': 'main',
                                                                                 'aeiou/datasets.py'),
                                 'aeiou.datasets.AudioDataset.get_next_chunk': ( 'datasets.html#audiodataset.get_next_chunk',
                                                                                 'aeiou/datasets.py'),
+                                'aeiou.datasets.AudioDataset.load_file': ('datasets.html#audiodataset.load_file', 'aeiou/datasets.py'),
                                 'aeiou.datasets.AudioDataset.load_file_ind': ( 'datasets.html#audiodataset.load_file_ind',
                                                                                'aeiou/datasets.py'),
                                 'aeiou.datasets.AudioDataset.preload_files': ( 'datasets.html#audiodataset.preload_files',
@@ -54,6 +169,9 @@ d = { 'settings': { 'branch': 'main',
                                 'aeiou.datasets.PadCrop.__call__': ('datasets.html#padcrop.__call__', 'aeiou/datasets.py'),
                                 'aeiou.datasets.PadCrop.__init__': ('datasets.html#padcrop.__init__', 'aeiou/datasets.py'),
                                 'aeiou.datasets.PadCrop.draw_chunk': ('datasets.html#padcrop.draw_chunk', 'aeiou/datasets.py'),
+                                'aeiou.datasets.PadCrop.draw_chunk_from_file': ( 'datasets.html#padcrop.draw_chunk_from_file',
+                                                                                 'aeiou/datasets.py'),
+                                'aeiou.datasets.PadCrop.pick_start': ('datasets.html#padcrop.pick_start', 'aeiou/datasets.py'),
                                 'aeiou.datasets.PadCrop_Normalized_T': ('datasets.html#padcrop_normalized_t', 'aeiou/datasets.py'),
                                 'aeiou.datasets.PadCrop_Normalized_T.__call__': ( 'datasets.html#padcrop_normalized_t.__call__',
                                                                                   'aeiou/datasets.py'),
@@ -106,9 +224,15 @@ d = { 'settings': { 'branch': 'main',
             'aeiou.spectrofu': { 'aeiou.spectrofu.main': ('spectrofu.html#main', 'aeiou/spectrofu.py'),
                                  'aeiou.spectrofu.process_one_file': ('spectrofu.html#process_one_file', 'aeiou/spectrofu.py'),
                                  'aeiou.spectrofu.save_stft': ('spectrofu.html#save_stft', 'aeiou/spectrofu.py')},
-            'aeiou.viz': { 'aeiou.viz.audio_spectrogram_image': ('viz.html#audio_spectrogram_image', 'aeiou/viz.py'),
+            'aeiou.viz': { 'aeiou.viz._colormap_lut': ('viz.html#_colormap_lut', 'aeiou/viz.py'),
+                           'aeiou.viz._mel_op': ('viz.html#_mel_op', 'aeiou/viz.py'),
+                           'aeiou.viz.audio_spectrogram_image': ('viz.html#audio_spectrogram_image', 'aeiou/viz.py'),
+                           'aeiou.viz.batch_mel_spectrogram': ('viz.html#batch_mel_spectrogram', 'aeiou/viz.py'),
+                           'aeiou.viz.colormap_lut': ('viz.html#colormap_lut', 'aeiou/viz.py'),
                            'aeiou.viz.embeddings_table': ('viz.html#embeddings_table', 'aeiou/viz.py'),
+                           'aeiou.viz.fast_spectrogram_image': ('viz.html#fast_spectrogram_image', 'aeiou/viz.py'),
                            'aeiou.viz.generate_melspec': ('viz.html#generate_melspec', 'aeiou/viz.py'),
+                           'aeiou.viz.get_mel_op': ('viz.html#get_mel_op', 'aeiou/viz.py'),
                            'aeiou.viz.mel_spectrogram': ('viz.html#mel_spectrogram', 'aeiou/viz.py'),
                            'aeiou.viz.on_colab': ('viz.html#on_colab', 'aeiou/viz.py'),
                            'aeiou.viz.pca_point_cloud': ('viz.html#pca_point_cloud', 'aeiou/viz.py'),
@@ -1,21 +1,83 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../03_chunkadelic.ipynb.
 
 # %% auto 0
-__all__ = ['blow_chunks', 'set_bit_rate', 'chunk_one_file', 'main']
+__all__ = ['output_params', 'chunk_filenames', 'save_chunk', 'save_chunks', 'blow_chunks', 'stream_chunks', 'ShardWriter',
+           'get_shard_writer', 'finish_shards', 'drop_from_shards', 'BackgroundSaver', 'get_saver', 'set_bit_rate',
+           'params_hash', 'load_chunk_manifest', 'needs_chunking', 'write_chunk_manifest', 'merge_shards',
+           'chunk_one_file', 'main']
 
 # %% ../03_chunkadelic.ipynb 5
 import argparse 
 import os 
+import json
+import time
+import io
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import hashlib
+from glob import glob, escape as glob_escape
 from functools import partial
-from tqdm.contrib.concurrent import process_map  
 import torch
 import torchaudio
+from torch.nn import functional as F
 import math
-from .core import is_silence, load_audio, makedir, get_audio_filenames, normalize_audio, get_dbmax
+from .core import is_silence, load_audio, makedir, get_audio_filenames, normalize_audio, get_dbmax, resample_tiers, get_shared_audio_index, iter_audio_filenames, stream_map, \
+    batch_it_crazy, batch_is_silence, batch_db, stream_audio, get_audio_info, size_batches, index_durations, \
+    shard_spec, hash_shard, balanced_shard, shard_filename, stage_stats, PipelineReport, WorkerRuntime, merge_report_files, shard_files
 import multiprocessing as mp
 from multiprocessing import Pool, cpu_count, Barrier
 
 # %% ../03_chunkadelic.ipynb 6
+def chunk_filenames(
+    new_filename:str,    # stem of new filename(s) to be output as chunks
+    start:int,           # index of first chunk
+    n:int,               # how many chunks
+    )->list:
+    "output filenames for chunks start...start+n-1, i.e. with --{i} before the extension"
+    _, ext = os.path.splitext(new_filename)
+    if not ext: return [f'{new_filename}--{i}' for i in range(start, start+n)]
+    parts = new_filename.split(ext)
+    return [(f'--{i}'+ext).join(parts) for i in range(start, start+n)]
+
+def save_chunk(out_filename, chunk, sr=48000, bits_per_sample=None):
+    "saves one chunk to a file and returns its name"
+    with stage_stats.time('save') as counts:
+        torchaudio.save(out_filename, chunk, sr, bits_per_sample=bits_per_sample)
+        counts['written'] = os.path.getsize(out_filename)
+    return out_filename
+
+def save_chunks(
+    chunks,              # list (or batch) of chunks to save
+    out_filenames:list,  # one filename per chunk
+    silent:list,         # one bool per chunk: True = don't save it
+    sr=48000,            # audio sample rate in Hz
+    thresh=-70,          # silence threshold in dB, just for the message
+    bits_per_sample=None, # kwarg for torchaudio.save, None means use defaults
+    debug=False,         # print debugging information 
+    writer=None,         # e.g. a ShardWriter, to write into .tar shards instead of individual files
+    starts=None,         # (with writer) offset of each chunk in the source, in samples at sr
+    source=None,         # (with writer) name of the source file, for the metadata
+    saver=None,          # a BackgroundSaver to queue the saves on, instead of doing them here
+    ):
+    "writes chunks to files (or via writer), except for silent ones. returns the list of files (or shard members) written; with saver, saver.wait() returns them instead"
+    written = []
+    for i, (chunk, out_filename, is_silent) in enumerate(zip(chunks, out_filenames, silent)):
+        if not is_silent:
+            if debug: print(f"     Saving output chunk {out_filename}, bits_per_sample={bits_per_sample}, chunk.shape={chunk.shape}", flush=True)
+            if writer is None:
+                save = save_chunk
+            else:
+                db = [float(x) if math.isfinite(x) else None for x in (batch_db(chunk[None])[0], batch_db(chunk[None], mode='rms')[0])]
+                meta = {'source':source, 'offset':None if starts is None else int(starts[i]), 'samples':chunk.shape[-1], 
+                        'channels':chunk.shape[0], 'sr':sr, 'db_peak':db[0], 'db_rms':db[1]}
+                save = partial(writer.write, meta=meta)
+            if saver is None: written.append(save(out_filename, chunk, sr, bits_per_sample=bits_per_sample))
+            else:             saver.submit(save, out_filename, chunk, sr, bits_per_sample=bits_per_sample)
+        else:
+            print(f"Skipping chunk {out_filename} because it's 'silent' (below threhold of {thresh} dB).",flush=True)
+    return written
+
 def blow_chunks(
     audio:torch.tensor,  # long audio file to be chunked
     new_filename:str,    # stem of new filename(s) to be output as chunks
@@ -28,35 +90,235 @@ def blow_chunks(
     bits_per_sample=None, # kwarg for torchaudio.save, None means use defaults
     nopad=False,     # disable zero-padding, allowing samples to be shorter than chunk_size (including "leftovers" on the "ends")
     debug=False,     # print debugging information 
+    norm_inplace=False, # normalize audio in place: saves a full-length copy, but modifies the audio that's passed in
+    writer=None,     # e.g. a ShardWriter, to write into .tar shards instead of individual files
+    source=None,     # (with writer) name of the source file, for the metadata
+    saver=None,      # a BackgroundSaver to queue the saves on; then saver.wait() returns what was written
     ):
-    "chunks up the audio and saves them with --{i} on the end of each chunk filename"
+    "chunks up the audio and saves them with --{i} on the end of each chunk filename. returns the list of files written"
     if (debug): print(f"       blow_chunks: audio.shape = {audio.shape}",flush=True)
         
-    #chunk = torch.zeros(audio.shape[0], chunk_size)  
-    _, ext = os.path.splitext(new_filename)
+    if norm in ['global','channel']:  
+        with stage_stats.time('normalize'): audio = normalize_audio(audio, norm, inplace=norm_inplace)
+
+    spacing = 0.5 if spacing == 0 else spacing # handle degenerate case as a request for the defaults
+    hop = max(1, int(spacing * chunk_size))
+    length = audio.shape[-1]
+    starts = range(0, length, hop)
+    n_full = 0 if length < chunk_size else (length - chunk_size) // hop + 1   # chunks that fit entirely inside audio
+    
+    # all chunks at once: strided views for the full ones, plus the few (zero-padded) leftovers at the end
+    with stage_stats.time('chunk'):
+        full = batch_it_crazy(audio, chunk_size, hop_len=hop, pad=False)[:n_full] if n_full > 0 else audio.new_zeros((0, audio.shape[0], chunk_size))
+        tails = [audio[:, start:] if nopad else F.pad(audio[:, start:], (0, chunk_size - (length - start))) for start in starts[n_full:]]
+        chunks = list(full) + tails
     
-    if norm in ['global','channel']:  audio = normalize_audio(audio, norm)     
+    if strip:  # one batched silence check instead of one per chunk
+        with stage_stats.time('silence'): silent = batch_is_silence(full, thresh=thresh).tolist() + [is_silence(t, thresh=thresh) for t in tails]
+    else:
+        silent = [False]*len(chunks)
+    return save_chunks(chunks, chunk_filenames(new_filename, 0, len(chunks)), silent, sr=sr, thresh=thresh, bits_per_sample=bits_per_sample, debug=debug,
+                       writer=writer, starts=starts, source=source, saver=saver)
 
+# %% ../03_chunkadelic.ipynb 10
+def stream_chunks(
+    filename:str,        # long audio file to be chunked
+    new_filename:str,    # stem of new filename(s) to be output as chunks
+    chunk_size:int,      # how big each audio chunk is, in samples
+    sr=48000,            # audio sample rate in Hz
+    norm='False',        # normalize input audio, based on the max of the absolute value ['global','channel', or anything else for None, e.g. False]
+    spacing=0.5,         # fraction of each chunk to advance between hops
+    strip=False,         # strip silence: chunks with max power in dB below this value will not be saved to files
+    thresh=-70,          # threshold in dB for determining what counts as silence
+    bits_per_sample=None, # kwarg for torchaudio.save, None means use defaults
+    nopad=False,         # disable zero-padding, allowing samples to be shorter than chunk_size (including "leftovers" on the "ends")
+    debug=False,         # print debugging information 
+    resample_quality='default', # key in resample_tiers
+    writer=None,         # e.g. a ShardWriter, to write into .tar shards instead of individual files
+    saver=None,          # a BackgroundSaver to queue the saves on; then saver.wait() returns what was written
+    ):
+    "like load_audio + blow_chunks, but reads the file incrementally, so memory use doesn't grow with its length. returns the list of files written"
     spacing = 0.5 if spacing == 0 else spacing # handle degenerate case as a request for the defaults
+    hop = max(1, int(spacing * chunk_size))
+    info = get_audio_info(filename)
+    if info['frames'] * sr / info['sr'] <= max(chunk_size, hop):  # short file: one block anyway, so just do it the usual way
+        audio = load_audio(filename, sr=sr, verbose=debug, resample_quality=resample_quality)
+        return blow_chunks(audio, new_filename, chunk_size, sr=sr, norm=norm, spacing=spacing, strip=strip, thresh=thresh,
+                           bits_per_sample=bits_per_sample, nopad=nopad, debug=debug, norm_inplace=True, writer=writer, source=filename, saver=saver)
+    blocks = lambda **kw: stream_audio(filename, sr=sr, block_size=max(chunk_size, hop), resample_quality=resample_quality, **kw)
+    scale = None
+    if norm in ['global','channel']:  # first pass: find the max, as normalize_audio would. timed as 'normalize', so the file isn't counted as read twice
+        amax = amin = None
+        for block in blocks(stage='normalize'):
+            amax = block.amax(dim=-1) if amax is None else torch.maximum(amax, block.amax(dim=-1))
+            amin = block.amin(dim=-1) if amin is None else torch.minimum(amin, block.amin(dim=-1))
+        if amax is not None:
+            absmax = torch.maximum(amax, -amin)[:, None]
+            if 'global' == norm: absmax = absmax.amax(dim=0, keepdim=True)
+            scale = torch.where(absmax != 0, 0.99/absmax, torch.ones_like(absmax))
+
+    written = []
+    buf, buf_start, i = None, 0, 0    # buf holds the audio from sample buf_start on. i = next chunk, which starts at i*hop
+    for block in blocks():
+        if scale is not None: block *= scale
+        buf = block if buf is None else torch.cat([buf, block], dim=-1)
+        n_ready = (buf_start + buf.shape[-1] - chunk_size) // hop + 1 - i   # how many more chunks are complete
+        if n_ready > 0:
+            chunks = batch_it_crazy(buf[:, i*hop - buf_start:], chunk_size, hop_len=hop, pad=False)[:n_ready]
+            if strip:
+                with stage_stats.time('silence'): silent = batch_is_silence(chunks, thresh=thresh).tolist()
+            else: silent = [False]*n_ready
+            written += save_chunks(chunks, chunk_filenames(new_filename, i, n_ready), silent, sr=sr, thresh=thresh, bits_per_sample=bits_per_sample, debug=debug,
+                                   writer=writer, starts=range(i*hop, (i+n_ready)*hop, hop), source=filename, saver=saver)
+            i += n_ready
+        drop = min(i*hop - buf_start, buf.shape[-1])   # nothing before the next chunk's start is needed anymore
+        buf, buf_start = buf[:, drop:], buf_start + drop
+    if buf is None: return written  # empty file
+    length = buf_start + buf.shape[-1]
+    starts = range(i*hop, length, hop)  # leftovers at the end, same as in blow_chunks
+    tails = [buf[:, start-buf_start:] if nopad else F.pad(buf[:, start-buf_start:], (0, chunk_size - (length - start))) for start in starts]
+    with stage_stats.time('silence'): silent = [is_silence(t, thresh=thresh) for t in tails] if strip else [False]*len(tails)
+    return written + save_chunks(tails, chunk_filenames(new_filename, i, len(tails)), silent, sr=sr, thresh=thresh, bits_per_sample=bits_per_sample, debug=debug,
+                                 writer=writer, starts=starts, source=filename, saver=saver)
+
+# %% ../03_chunkadelic.ipynb 13
+class ShardWriter():
+    "writes chunks into numbered, size-balanced WebDataset .tar shards in path, with a .json of metadata for each"
+    def __init__(self, 
+        path:str,          # directory for the shards
+        shard_mb=1000,     # start a new shard once the current one is this big, in MB
+        fmt='flac',        # audio format of the members: 'flac' or 'wav'
+        ):
+        self.path, self.max_bytes, self.fmt = path, int(shard_mb * 2**20), fmt
+        self.tar, self.shard, self.next_num = None, None, None
+        self.lock = threading.Lock()   # encoding can happen in several threads at once, adding to the tar can't
+        
+    def claim_shard(self):
+        "opens the next free shard number. creating it exclusively means other workers (or nodes) never get the same one"
+        if self.next_num is None: 
+            nums = [int(f[:-4]) for f in os.listdir(self.path) if f.endswith('.tar') and f[:-4].isdigit()]
+            self.next_num = max(nums, default=-1) + 1
+        while True:
+            self.shard, self.next_num = f'{self.path}/{self.next_num:06d}.tar', self.next_num + 1
+            try: 
+                fd = os.open(self.shard, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+                break
+            except FileExistsError: continue
+        self.tar = tarfile.open(fileobj=os.fdopen(fd, 'wb'), mode='w')
     
-    start, i = 0, 0
-    while start < audio.shape[-1]:
-        out_filename = new_filename.replace(ext, f'--{i}'+ext) 
-        end = min(start + chunk_size, audio.shape[-1])
-        if (end-start < chunk_size) and not nopad:  # audio shorter than chunk_size: pad with zeros
-            chunk = torch.zeros(audio.shape[0], chunk_size) 
-            chunk[:,0:end-start] = audio[:,start:end]
-        else:
-            chunk = audio[:,start:end]
-        if (not strip) or (not is_silence(chunk, thresh=thresh)):
-            if debug: print(f"     Saving output chunk {out_filename}, bits_per_sample={bits_per_sample}, chunk.shape={chunk.shape}", flush=True)
-            torchaudio.save(out_filename, chunk, sr, bits_per_sample=bits_per_sample)
-        else:
-            print(f"Skipping chunk {out_filename} because it's 'silent' (below threhold of {thresh} dB).",flush=True)
-        start, i = start + int(spacing * chunk_size), i + 1
-    return 
+    def add(self, name, data:bytes):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        self.tar.addfile(info, io.BytesIO(data))
+        
+    def write(self, 
+        out_filename:str,   # what the chunk would have been called as a file; its path under self.path becomes the key
+        audio,              # the chunk
+        sr=48000,           # sample rate
+        bits_per_sample=None, # kwarg for torchaudio.save
+        meta={},            # goes in the .json
+        )->str:
+        "encodes audio and adds it to the current shard, returning 'shard:key'"
+        buf = io.BytesIO()
+        with stage_stats.time('encode'): torchaudio.save(buf, audio, sr, format=self.fmt, bits_per_sample=bits_per_sample)
+        key = os.path.relpath(os.path.splitext(out_filename)[0], self.path).replace('.', '_')   # webdataset splits keys at the first '.'
+        with self.lock, stage_stats.time('write') as counts:
+            if self.tar is None: self.claim_shard()
+            start = self.tar.offset
+            self.add(f'{key}.{self.fmt}', buf.getvalue())
+            self.add(f'{key}.json', json.dumps(meta).encode('utf-8'))
+            self.tar.fileobj.flush()   # whole members on disk, in case this process gets killed
+            shard, counts['written'] = self.shard, self.tar.offset - start
+            if self.tar.offset >= self.max_bytes: self.close()
+        return f'{shard}:{key}'
+    
+    def close(self):
+        "finishes the current shard"
+        if self.tar is None: return
+        self.tar.close()
+        self.tar.fileobj.close()
+        self.tar = None
+
+_shard_writer = None   # one per worker process, kept open from one file to the next so shards fill up
+
+def get_shard_writer(args):
+    "this process's ShardWriter for chunkadelic args"
+    global _shard_writer
+    if _shard_writer is None: _shard_writer = ShardWriter(args.output_path, shard_mb=args.shard_mb, fmt=args.wds_format)
+    return _shard_writer
+
+def finish_shards(
+    shards,   # shard filenames
+    ):
+    "adds the end-of-archive marker to shards a worker left open. ones that were closed are left alone"
+    for shard in sorted(set(shards)):
+        with tarfile.open(shard) as tar:
+            tar.getmembers()
+            end = tar.offset   # end of the last member
+        if os.path.getsize(shard) > end: continue
+        with open(shard, 'ab') as f:   # as tarfile.close() would: two zero blocks, padded out to a whole record
+            f.write(tarfile.NUL * 2 * tarfile.BLOCKSIZE)
+            f.write(tarfile.NUL * (-f.tell() % tarfile.RECORDSIZE))
+
+def drop_from_shards(
+    superseded,   # 'shard:key' outputs to remove, e.g. the chunks of inputs that have changed since
+    )->int:
+    "rewrites the shards these keys are in without their members. returns how many members were dropped"
+    by_shard, n_dropped = {}, 0
+    for output in superseded:
+        shard, _, key = output.partition('.tar:')
+        by_shard.setdefault(shard + '.tar', set()).add(key)
+    for shard, keys in sorted(by_shard.items()):
+        if not os.path.exists(shard): continue
+        lock = shard + '.lock'   # other nodes may be rewriting the same shard. claimed like shard numbers are
+        while True:
+            try: os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)); break
+            except FileExistsError: time.sleep(0.1)
+        try:
+            tmp_file = f'{shard}.{os.getpid()}.tmp'
+            with tarfile.open(shard) as src, tarfile.open(tmp_file, 'w') as dst:
+                for member in src:
+                    if member.name.partition('.')[0] in keys: n_dropped += 1   # keys have no '.'s, see ShardWriter.write
+                    else: dst.addfile(member, src.extractfile(member))
+            os.replace(tmp_file, shard)
+        finally: os.remove(lock)
+    return n_dropped
+
+# %% ../03_chunkadelic.ipynb 16
+class BackgroundSaver():
+    "runs saves in a small pool of threads, with at most `depth` of them queued or running at once"
+    def __init__(self, 
+        threads=2,   # number of writer threads
+        depth=8,     # how many saves can be queued (or running) before submit() has to wait
+        ):
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        self.slots = threading.BoundedSemaphore(depth)
+        self.futures, self.stalls = [], 0
+        
+    def submit(self, func, *args, **kwargs):
+        "queues func(*args, **kwargs). blocks while the queue is full, counting that as a stall"
+        if not self.slots.acquire(blocking=False):
+            self.stalls += 1
+            self.slots.acquire()
+        future = self.pool.submit(func, *args, **kwargs)
+        future.add_done_callback(lambda f: self.slots.release())
+        self.futures.append(future)
+        
+    def wait(self)->list:
+        "waits for everything queued so far and returns their results, in order. raises the first error, if there was one"
+        futures, self.futures = self.futures, []
+        wait(futures)
+        return [f.result() for f in futures]
+
+_saver = None   # one per worker process
 
-# %% ../03_chunkadelic.ipynb 7
+def get_saver(args):
+    "this process's BackgroundSaver for chunkadelic args, or None if writes should be synchronous"
+    global _saver
+    if args.write_threads > 0 and _saver is None: _saver = BackgroundSaver(threads=args.write_threads, depth=args.write_queue)
+    return _saver
+
+# %% ../03_chunkadelic.ipynb 18
 def set_bit_rate(bits, filename, debug=False):
     if (bits is None) or isinstance(bits, int): bits_per_sample = bits
     elif bits.lower()=='none': 
@@ -72,14 +334,69 @@ def set_bit_rate(bits, filename, debug=False):
     if debug: print("     set_bit_rate: bits_per_sample =",bits_per_sample,flush=True)
     return bits_per_sample
 
-# %% ../03_chunkadelic.ipynb 8
+# %% ../03_chunkadelic.ipynb 20
+output_params = ['output_path', 'chunk_size', 'sr', 'resample_quality', 'norm', 'spacing', 'strip', 'thresh', 'bits', 'nopad']  # args that affect output
+
+def params_hash(args)->str:
+    "short hash of the chunkadelic args that affect what gets written"
+    params = {k: getattr(args, k, None) for k in output_params}
+    if getattr(args, 'wds', False): params.update(wds=True, wds_format=args.wds_format)   # only when set, so older manifests stay valid
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+def load_chunk_manifest(
+    manifest_file:str,   # json-lines file written by chunkadelic
+    )->dict:
+    "reads a chunkadelic manifest into a dict of {input path: record}. later records for the same path win"
+    records = {}
+    try:
+        with open(manifest_file) as f:
+            for line in f:
+                try: record = json.loads(line)
+                except ValueError: continue   # e.g. a partial last line from a run that got killed
+                records[record['path']] = record
+    except FileNotFoundError: pass
+    return records
+
+def needs_chunking(
+    filename:str,   # input file
+    record,         # its manifest record, or None
+    params:str,     # params_hash of the current args
+    )->bool:
+    "True if filename is new or has changed (or the args have) since it was last chunked"
+    if record is None or record['params'] != params: return True
+    try: st = os.stat(filename)
+    except OSError: return True
+    return (st.st_size != record['size']) or (st.st_mtime != record['mtime'])
+
+# %% ../03_chunkadelic.ipynb 23
+def write_chunk_manifest(
+    records:dict,        # {input path: record}, e.g. from load_chunk_manifest
+    manifest_file:str,   # where to write them
+    ):
+    "(re)writes a whole manifest. write then rename, so that a crash can't leave a partial one"
+    with open(manifest_file + '.tmp', 'w') as f:
+        for record in records.values(): f.write(json.dumps(record) + '\n')
+    os.replace(manifest_file + '.tmp', manifest_file)
+
+def merge_shards(
+    manifest_file:str,   # the main manifest, e.g. output_path/chunkadelic_manifest.jsonl
+    stats_file:str,      # the main stats file, e.g. output_path/chunkadelic_stats.json
+    )->dict:
+    "folds the per-shard manifests & stats (i.e. PipelineReports) into the main ones, and removes the per-shard files. returns the merged stats"
+    records = load_chunk_manifest(manifest_file)
+    for f in shard_files(manifest_file): records.update(load_chunk_manifest(f))
+    write_chunk_manifest(records, manifest_file)
+    for f in shard_files(manifest_file): os.remove(f)
+    return merge_report_files(stats_file)
+
+# %% ../03_chunkadelic.ipynb 25
 def chunk_one_file(
     filenames:list,      # list of filenames from which we'll pick one
     args,                # output of argparse
-    file_ind             # index from filenames list to read from
+    file_ind             # index from filenames list to read from, or the filename itself (then filenames can be None)
     ):
-    "this chunks up one file by setting things up and then calling blow_chunks"
-    filename = filenames[file_ind]  # this is actually input_path+/+filename
+    "this chunks up one file by setting things up and then calling blow_chunks. returns a manifest record, or None if it failed"
+    filename = file_ind if isinstance(file_ind, str) else filenames[file_ind]  # this is actually input_path+/+filename
     output_path, input_paths = args.output_path, args.input_paths
     new_filename = None
     if args.debug: print(f" --- process_one_file: filenames[{file_ind}] = {filename}\n", flush=True)
@@ -90,58 +407,155 @@ def chunk_one_file(
             last_ipath = ipath.split('/')[-1]           # get the last part of ipath
             clean_filename = filename.replace(ipath,'') # remove all of ipath from the front of filename
             new_filename = f"{output_path}/{last_ipath}/{clean_filename}".replace('//','/') 
-            makedir(os.path.dirname(new_filename))      # we might need to make a directory for the output file
+            if not args.wds: makedir(os.path.dirname(new_filename))  # we might need to make a directory for the output file
             break
 
     if new_filename is None:
         print(f"ERROR: Something went wrong with name of input file {filename}. Skipping.",flush=True) 
         return 
     
+    saver, t0 = None, time.perf_counter()
+    stage_stats.pop()   # start this file's stats from zero
     try:  # try to load the audio file and chunk it up
-        if args.debug: print(f"   About to load filenames[{file_ind}] = {filename}\n", flush=True)
-        audio = load_audio(filename, sr=args.sr, verbose=args.debug)
-        if args.debug: print(f"   We loaded the audio, audio.shape = {audio.shape}.  Setting bit rate.",flush=True)  
+        st = os.stat(filename)   # before reading, so that a file changing while we work counts as changed
         bits_per_sample = set_bit_rate(args.bits, filename, debug=args.debug)
-        if args.debug: print(f"   Bit rate set.  Calling blow_chunks...", flush=True)
-        blow_chunks(audio, new_filename, args.chunk_size, sr=args.sr, spacing=args.spacing, 
-                    strip=args.strip, thresh=args.thresh, bits_per_sample=bits_per_sample, nopad=args.nopad, debug=args.debug)
+        writer = get_shard_writer(args) if args.wds else None
+        saver = get_saver(args)
+        stalls = 0 if saver is None else saver.stalls
+        if args.stream:
+            outputs = stream_chunks(filename, new_filename, args.chunk_size, sr=args.sr, norm=args.norm, spacing=args.spacing, strip=args.strip,
+                          thresh=args.thresh, bits_per_sample=bits_per_sample, nopad=args.nopad, debug=args.debug, resample_quality=args.resample_quality,
+                          writer=writer, saver=saver)
+        else:
+            if args.debug: print(f"   About to load filenames[{file_ind}] = {filename}\n", flush=True)
+            audio = load_audio(filename, sr=args.sr, verbose=args.debug, resample_quality=args.resample_quality)
+            if args.debug: print(f"   We loaded the audio, audio.shape = {audio.shape}.  Calling blow_chunks...",flush=True)  
+            outputs = blow_chunks(audio, new_filename, args.chunk_size, sr=args.sr, norm=args.norm, spacing=args.spacing, strip=args.strip, 
+                        thresh=args.thresh, bits_per_sample=bits_per_sample, nopad=args.nopad, debug=args.debug, norm_inplace=True,
+                        writer=writer, source=filename, saver=saver)
+        if saver is not None: outputs += saver.wait()   # everything's on disk before it goes in the manifest
     except Exception as e: 
         print(f"Error '{e}' while loading {filename} or writing chunks. Skipping.", flush=True)
+        if saver is not None:   # don't leave this file's writes for the next one
+            try: saver.wait()
+            except Exception: pass
+        return None
 
     if args.debug: print(f" --- File {file_ind}: {filename} completed.\n", flush=True)
-    return
+    return {'path':filename, 'size':st.st_size, 'mtime':st.st_mtime, 'params':params_hash(args), 'outputs':outputs,
+            'stats':{'secs':time.perf_counter() - t0, 'stages':stage_stats.pop(), 'chunks':len(outputs),   # main() takes the stats out 
+                     'writer_stalls':0 if saver is None else saver.stalls - stalls}}                       # before writing the manifest
 
-# %% ../03_chunkadelic.ipynb 12
+# %% ../03_chunkadelic.ipynb 29
 def main():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--chunk_size', type=int, default=2**17, help='Length of chunks')
     parser.add_argument('--sr', type=int, default=48000, help='Output sample rate')
+    parser.add_argument('--resample_quality', default='default', choices=list(resample_tiers.keys()), help='Speed/quality tradeoff for resampling')
     parser.add_argument('--norm', default='False', const='False', nargs='?', choices=['False', 'global', 'channel'],
                    help='Normalize audio, based on the max of the absolute value [global/channel/False]')
     parser.add_argument('--spacing', type=float, default=0.5, help='Spacing factor, advance this fraction of a chunk per copy')
     parser.add_argument('--strip', action='store_true', help='Strips silence: chunks with max dB below <thresh> are not outputted')
     parser.add_argument('--thresh', type=int, default=-70, help='threshold in dB for determining what constitutes silence')
     parser.add_argument('--bits', type=str, default='None', help='Bit depth: "None" uses torchaudio default | "match"=match input audio files | or specify an int')
-    parser.add_argument('--workers', type=int, default=min(32, os.cpu_count() + 4), help='Maximum number of workers to use (default: all)')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes. Default: as many as fit on the available CPUs, given --threads')
+    parser.add_argument('--threads', type=int, default=None, help='torch/OpenMP/MKL threads per worker. Default: share the CPUs out evenly between --workers, or 1 if --workers is not given either')
+    parser.add_argument('--pin_cpus', action='store_true', help='Pin each worker to its own block of --threads CPUs (Linux only)')
     parser.add_argument('--nomix', action='store_true',  help='(BDCT Dataset specific) exclude output of "*/Audio Files/*Mix*"')
     parser.add_argument('--nopad', action='store_true',  help='Disable zero padding for audio shorter than chunk_size')
+    parser.add_argument('--stream', action='store_true', help="Read & chunk each file a block at a time, so memory use doesn't grow with file length")
+    parser.add_argument('--wds', action='store_true', help='Write chunks into WebDataset .tar shards (000000.tar, ...) in output_path instead of individual files')
+    parser.add_argument('--wds_format', default='flac', choices=['flac', 'wav'], help='(with --wds) Audio format of the chunks in the shards')
+    parser.add_argument('--shard_mb', type=float, default=1000, help='(with --wds) Start a new shard once the current one reaches this size in MB')
+    parser.add_argument('--write_threads', type=int, default=2, help='Threads per worker that encode & write chunks in the background. 0 = write synchronously')
+    parser.add_argument('--write_queue', type=int, default=8, help='(with --write_threads) How many chunks can wait to be written before a worker stalls')
+    parser.add_argument('--manifest', default='', help='Manifest of completed inputs, for resuming. Default is chunkadelic_manifest.jsonl in output_path')
+    parser.add_argument('--no_resume', action='store_true', help='Re-chunk all inputs, even ones the manifest says are done')
+    parser.add_argument('--batch_secs', type=float, default=600, help='(with --index) Files shorter than this get sent to workers in batches of about this many seconds of audio')
+    parser.add_argument('--shard_index', type=int, default=None, help='Which of the --num_shards shards of the inputs to chunk. Default: from $SLURM_ARRAY_TASK_ID, else 0')
+    parser.add_argument('--num_shards', type=int, default=None, help='Split the inputs into this many shards, e.g. one per node. Default: $SLURM_ARRAY_TASK_COUNT, else 1')
+    parser.add_argument('--merge', action='store_true', help="Merge the per-shard manifests & stats in output_path (after all shards are done) and exit")
+    parser.add_argument('--index', default='', help='Audio metadata index file (.npz). Loaded instead of scanning input_paths if it exists, otherwise built & saved')
     parser.add_argument('output_path', help='Path of output for chunkified data')
-    parser.add_argument('input_paths', nargs='+', help='Path(s) of a file or a folder of files. (recursive)')
+    parser.add_argument('--report', default='', help='Also write the run\'s throughput report (as in chunkadelic_stats.json) here, as .json or .csv')
+    parser.add_argument('input_paths', nargs='*', help='Path(s) of a file or a folder of files. (recursive)')
     parser.add_argument('--verbose', action='store_true',  help='Extra output logging')
     parser.add_argument('--debug', action='store_true',  help='Extra EXTRA output logging')
     args = parser.parse_args()
+    manifest_main, stats_main = args.manifest or f'{args.output_path}/chunkadelic_manifest.jsonl', f'{args.output_path}/chunkadelic_stats.json'
+    if args.merge:
+        print("chunkadelic: merged stats =", merge_shards(manifest_main, stats_main))
+        return
+    if not args.input_paths: parser.error("need at least one input path")
+    shard_index, num_shards = shard_spec(args.shard_index, args.num_shards)
+    runtime = WorkerRuntime(args.workers, args.threads, pin=args.pin_cpus)  # workers x threads, so torch doesn't oversubscribe the CPUs
+    print(f"  {runtime}")
+    report = PipelineReport()
    
     if args.verbose: 
         print("chunkadelic: args = ",args)
-        print("Getting list of input filenames")
-    filenames = get_audio_filenames(args.input_paths)
+        print("Getting input filenames")
+    if args.index:  # we know the whole list up front
+        index = get_shared_audio_index(args.input_paths, args.index, shard_index, num_shards)   # built once, by shard 0
+        filenames, durations = index['path'], dict(zip(index['path'], index_durations(index)))
+        if num_shards > 1: filenames = balanced_shard(filenames, index_durations(index), shard_index, num_shards)
+        if args.verbose: print(f"  Got {len(filenames)} input filenames") 
+    else:           # start chunking while we're still scanning
+        filenames = hash_shard(iter_audio_filenames(args.input_paths), shard_index, num_shards)
     if args.verbose:
-        print(f"  Got {len(filenames)} input filenames") 
         if not (args.norm in ['global','channel']): 
             print(f"Warning: since norm = {args.norm}, no normalizations will be performed.")
         print("Processing files (in parallel)...")
             
-    wrapper = partial(chunk_one_file, filenames, args)
-    r = process_map(wrapper, range(len(filenames)), chunksize=1, max_workers=args.workers)  # different chunksize used by tqdm. max_workers is to avoid annoying other ppl
+    makedir(args.output_path)
+    manifest_file = shard_filename(manifest_main, shard_index, num_shards)   # each shard appends only to its own
+    mine = {} if args.no_resume else load_chunk_manifest(manifest_file)
+    write_chunk_manifest(mine, manifest_file)   # compact the manifest, so reruns don't keep growing it
+    done = {**load_chunk_manifest(manifest_main), **mine} if (num_shards > 1 and not args.no_resume) else mine
+    superseded_file = shard_filename(f'{args.output_path}/chunkadelic_superseded.jsonl', shard_index, num_shards)
+    if args.wds and args.no_resume and glob(f'{glob_escape(args.output_path)}/*.tar'):
+        print(f"chunkadelic: WARNING: --no_resume with --wds appends new copies of every chunk to the shards already in {args.output_path}, "
+              "under the same keys as the old ones. Use an empty output_path instead.", flush=True)
+    params, n_skipped = params_hash(args), [0]
+
+    def todo(filenames):  # only what's new or changed
+        for filename in filenames:
+            record = done.get(filename)
+            if not needs_chunking(filename, record, params): 
+                n_skipped[0] += 1
+                continue
+            if record is not None:   # clear out what it produced last time
+                for output in record['outputs']:
+                    if '.tar:' in output: superseded.write(json.dumps(output) + '\n')   # in a shard: dropped at the end
+                    elif os.path.exists(output): os.remove(output)
+                superseded.flush()
+            yield filename
+            
+    shards = set()   # shards written to this run, to finish at the end. (not all the records: there could be millions)
+    with open(manifest_file, 'a') as manifest, open(superseded_file, 'a') as superseded:
+        def record(r):
+            if r is None: return report.add(failed=1)
+            report.add_file(r['path'], **r.pop('stats'))
+            if args.wds: shards.update(o.partition('.tar:')[0] + '.tar' for o in r['outputs'])
+            manifest.write(json.dumps(r) + '\n')
+            manifest.flush()   # so that it's there even if we get killed
+        wrapper = partial(chunk_one_file, None, args)
+        if args.index:  # with an index we know how many files there are & how long: do the longest first, & batch up the short ones
+            jobs = list(todo(filenames))
+            jobs, total = size_batches(jobs, [durations[f] for f in jobs], min_batch=args.batch_secs), len(jobs)
+        else: 
+            jobs, total = todo(filenames), None
+        stream_map(wrapper, jobs, runtime=runtime, total=total, unit='file', callback=record, batched=bool(args.index), keep_results=False)  # --workers is to avoid annoying other ppl
+    if args.wds: finish_shards(shards)
+    with open(superseded_file) as f: superseded = [json.loads(line) for line in f]   # incl. any left by a run that was killed
+    if superseded: print(f"chunkadelic: dropped {drop_from_shards(superseded)} superseded member(s) from the shards of re-chunked inputs")
+    os.remove(superseded_file)
+    if args.verbose and n_skipped[0] > 0: print(f"Skipped {n_skipped[0]} unchanged file(s) already in the manifest")
+    report.add(skipped=n_skipped[0])
+    counts = report.counts
+    print(f"chunkadelic: chunked {counts.get('files', 0)} file(s) into {counts.get('chunks', 0)} chunk(s). writer stalls: {counts.get('writer_stalls', 0)}")
+    print(report.summary())
+    report.save(shard_filename(stats_main, shard_index, num_shards))
+    if args.report: report.save(shard_filename(args.report, shard_index, num_shards))
   
     if args.verbose: print("Finished")      
@@ -1,9 +1,18 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../00_core.ipynb.
 
 # %% auto 0
-__all__ = ['pdlbd_exts', 'get_device', 'is_tool', 'normalize_audio', 'load_audio', 'get_dbmax', 'audio_float_to_int',
-           'is_silence', 'batch_it_crazy', 'makedir', 'fast_scandir', 'get_audio_filenames', 'untuple',
-           'get_latest_ckpt', 'rnd_string', 'get_run_info']
+__all__ = ['stage_stats', 'resample_tiers', 'pdlbd_exts', 'decoders', 'default_decoder_prefs', 'decoder_prefs_file', 'audio_exts',
+           'index_cols', 'thread_env_vars', 'heavy_modules', 'ckpt_index_name', 'get_device', 'is_tool',
+           'normalize_audio', 'StageStats', 'get_resampler', 'get_decoder_prefs', 'load_audio', 'get_audio_info',
+           'StreamingResampler', 'stream_audio', 'AudioCache', 'get_dbmax', 'audio_float_to_int', 'is_silence',
+           'batch_it_crazy', 'unbatch_it_crazy', 'batch_db', 'batch_is_silence', 'makedir', 'iter_scan_dirs',
+           'scan_dirs', 'fast_scandir', 'iter_audio_filenames', 'get_audio_filenames', 'stream_map', 'load_audio_index',
+           'save_audio_index', 'build_audio_index', 'get_audio_index', 'get_shared_audio_index', 'size_batches',
+           'index_durations', 'available_cpus', 'WorkerRuntime', 'shard_spec', 'hash_shard', 'balanced_shard',
+           'shard_filename', 'shard_files', 'PipelineReport', 'merge_reports', 'merge_report_files', 'pack_corpus',
+           'packed_to_float', 'PackedCorpus', 'bench_decoders', 'save_decoder_prefs', 'bench_decode_main', 'untuple',
+           'import_benchmark', 'register_ckpt', 'latest_indexed_ckpt', 'find_ckpts', 'get_latest_ckpt', 'rnd_string',
+           'get_run_info']
 
 # %% ../00_core.ipynb 4
 import torch
@@ -11,7 +20,6 @@ import torchaudio
 from torchaudio import transforms as T
 from torch.nn import functional as F
 import numpy as np
-from librosa import load as lr_load
 from pedalboard.io import AudioFile, get_supported_read_formats
 import os
 import math
@@ -21,6 +29,21 @@ import string
 import glob
 from pathlib import Path
 import warnings
+from functools import lru_cache, partial
+from multiprocessing import Pool, cpu_count, current_process
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from contextlib import contextmanager
+import json
+from tqdm.auto import tqdm
+import sys
+import subprocess
+import hashlib
+import zipfile
+import inspect
+import heapq
+import time
+import argparse
 
 # %% ../00_core.ipynb 5
 def get_device(gpu_str=''):
@@ -45,65 +68,369 @@ def is_tool(name):
 
 # %% ../00_core.ipynb 9
 def normalize_audio(
-    audio_in,       # input array/tensor  (numpy or Pytorch)
+    audio_in,       # input array/tensor  (numpy or Pytorch), shape (n), (c,n) or batched (...,c,n)
     norm='global', # global (use max-abs of whole clip) | channel (per-channel norm'd individually) | ''/None
+    inplace=False, # True = scale audio_in itself rather than making a new copy. saves memory for long files
     ):
     "normalize audio, based on the max of the absolute value"
-    audio_out = audio_in.clone() if torch.is_tensor(audio_in) else audio_in.copy()  # rudimentary PyTorch/NumPy support
-    if ('global' == norm) or  len(audio_in.shape)< 2:
-        absmax = abs(audio_in).max()
-        audio_out = 0.99*audio_in/absmax if absmax != 0 else audio_in  # 0.99 = just below clipping
-    elif 'channel' == norm:
-        for c in range(audio_in.shape[0]):  # this loop is slow but sure. TODO: do it fast but still avoid div by zero
-            absmax = abs(audio_in[c]).max()
-            audio_out[c] = 0.99*audio_in[c]/absmax if absmax != 0 else audio_in[c]  # 0.99 = just below clipping
-      #anything else, pass unchanged
-    return audio_out
-
-# %% ../00_core.ipynb 19
+    if (norm not in ['global','channel']) or (0 == audio_in.size if isinstance(audio_in, np.ndarray) else 0 == audio_in.numel()):
+        if inplace: return audio_in  #anything else, pass unchanged
+        return audio_in.clone() if torch.is_tensor(audio_in) else audio_in.copy()  # rudimentary PyTorch/NumPy support
+    dims = (-1,) if 'channel' == norm else tuple(range(-min(2, len(audio_in.shape)), 0))  # global = each whole clip in a batch
+    if torch.is_tensor(audio_in):  # max & -min rather than abs().max(), to avoid making a full-size temporary copy
+        absmax = torch.maximum(audio_in.amax(dim=dims, keepdim=True), -audio_in.amin(dim=dims, keepdim=True))
+        scale = torch.where(absmax != 0, 0.99/absmax, torch.ones_like(absmax))   # 0.99 = just below clipping
+    else:
+        absmax = np.maximum(audio_in.max(axis=dims, keepdims=True), -audio_in.min(axis=dims, keepdims=True))
+        scale = np.divide(0.99, absmax, out=np.ones_like(absmax, dtype=np.result_type(absmax.dtype, np.float32)), where=(absmax != 0))
+    if inplace:
+        audio_in *= scale
+        return audio_in
+    return audio_in * scale
+
+# %% ../00_core.ipynb 21
+class StageStats():
+    "per-process running totals of the time spent, and e.g. bytes moved, in each stage of a pipeline"
+    def __init__(self):
+        self.lock, self.stages = threading.Lock(), {}   # writer threads add to it too
+        
+    def add(self, 
+        stage:str,    # name of the stage, e.g. 'decode'
+        **counts,     # numbers to add to its totals, e.g. secs=, calls=, read= or written= (bytes), audio_secs=
+        ):
+        with self.lock:
+            totals = self.stages.setdefault(stage, {})
+            for k, v in counts.items(): totals[k] = totals.get(k, 0) + v
+            
+    @contextmanager
+    def time(self, stage:str):
+        "times the with-block as one call of stage. anything put in the dict it yields gets added as well"
+        counts, t0 = {}, time.perf_counter()
+        try: yield counts
+        finally: self.add(stage, secs=time.perf_counter() - t0, calls=1, **counts)
+        
+    def pop(self)->dict:
+        "returns the totals so far, and starts again from zero"
+        with self.lock: stages, self.stages = self.stages, {}
+        return stages
+
+stage_stats = StageStats()   # one per process
+
+# %% ../00_core.ipynb 25
+resample_tiers = {   # speed/quality tradeoffs for resampling, as kwargs to torchaudio.transforms.Resample
+    'fast':        dict(lowpass_filter_width=6,  rolloff=0.85),
+    'default':     dict(),  # torchaudio's defaults
+    'kaiser_fast': dict(lowpass_filter_width=16, rolloff=0.85,   resampling_method='sinc_interp_kaiser', beta=8.555),  # cf. librosa's kaiser_fast
+    'kaiser_best': dict(lowpass_filter_width=64, rolloff=0.9475, resampling_method='sinc_interp_kaiser', beta=14.77),  # cf. librosa's kaiser_best
+}
+
+@lru_cache(maxsize=32)
+def get_resampler(
+    in_sr:int,              # input sample rate in Hz
+    out_sr:int,             # output sample rate in Hz
+    dtype=torch.float32,    # dtype of the audio that'll be resampled
+    quality='default',      # key in resample_tiers
+    ):
+    "cached Resample transform. Hit/miss counts are available via get_resampler.cache_info()"
+    kwargs = dict(resample_tiers[quality])
+    try:
+        return T.Resample(in_sr, out_sr, dtype=dtype, **kwargs)
+    except ValueError:  # older torchaudio called it 'kaiser_window'
+        kwargs['resampling_method'] = 'kaiser_window'
+        return T.Resample(in_sr, out_sr, dtype=dtype, **kwargs)
+
+# %% ../00_core.ipynb 29
 pdlbd_exts = None      # stores supported pedalboard file extensions. Global so it updates once per run
 
+def _decode_torchaudio(filename, offset=0.0, duration=None):
+    if (offset > 0) or (duration is not None):  # only decode the part we want
+        in_sr = torchaudio.info(filename).sample_rate
+        num_frames = -1 if duration is None else int(math.ceil(duration*in_sr))
+        return torchaudio.load(filename, frame_offset=int(round(offset*in_sr)), num_frames=num_frames)
+    return torchaudio.load(filename)
+
+def _decode_soundfile(filename, offset=0.0, duration=None):
+    import soundfile as sf
+    with sf.SoundFile(filename) as f:
+        in_sr = f.samplerate
+        start = min(int(round(offset*in_sr)), f.frames)
+        if start > 0: f.seek(start)
+        num_frames = -1 if duration is None else int(math.ceil(duration*in_sr))
+        audio = f.read(num_frames, dtype='float32', always_2d=True)
+    return torch.from_numpy(audio.T.copy()), in_sr
+
+def _decode_pedalboard(filename, offset=0.0, duration=None):
+    global pdlbd_exts
+    pdlbd_exts = get_supported_read_formats() if pdlbd_exts==None else pdlbd_exts
+    if os.path.splitext(filename)[1].lower() not in pdlbd_exts: 
+        raise ValueError(f"pedalboard can't read {filename}")
+    with AudioFile(filename) as f:
+        in_sr = f.samplerate
+        start = min(int(round(offset*in_sr)), f.frames)
+        if start > 0: f.seek(start)
+        num_frames = f.frames - start if duration is None else min(int(math.ceil(duration*in_sr)), f.frames - start)
+        return torch.tensor(f.read(num_frames)), in_sr
+
+def _decode_librosa(filename, offset=0.0, duration=None):
+    from librosa import load as lr_load  # imported here b/c librosa is slow to import
+    audio, in_sr = lr_load(filename, mono=False, sr=None, offset=offset, duration=duration)
+    audio = torch.tensor(audio)
+    return (audio if len(audio.shape) > 1 else audio.unsqueeze(0)), in_sr
+
+decoders = {  # registry of audio decoders: func(filename, offset, duration) -> (audio as (c,n) tensor, sample rate)
+    'torchaudio': _decode_torchaudio,
+    'soundfile':  _decode_soundfile,
+    'pedalboard': _decode_pedalboard,
+    'librosa':    _decode_librosa,
+    }
+
+default_decoder_prefs = {'.mp3':['pedalboard','librosa'], '':['torchaudio']}  # '' = any other extension
+decoder_prefs_file = os.environ.get('AEIOU_DECODER_PREFS', os.path.expanduser('~/.cache/aeiou/decoder_prefs.json'))
+_decoder_prefs = None  # loaded on first use
+
+def get_decoder_prefs(
+    reload=False,  # re-read decoder_prefs_file, e.g. after benchmarking
+    )->dict:
+    "which decoders load_audio tries, in order, for each file extension. saved prefs (from aeiou-bench-decode) override defaults"
+    global _decoder_prefs
+    if _decoder_prefs is None or reload:
+        _decoder_prefs = dict(default_decoder_prefs)
+        try:
+            with open(decoder_prefs_file) as f: _decoder_prefs.update(json.load(f))
+        except (OSError, ValueError): pass
+    return _decoder_prefs
+
 def load_audio(
     filename:str,     # name of file to load
     sr=48000,         # sample rate in Hz
     verbose=True,     # whether or not to print notices of resampling
     norm='',          # passedto normalize_audio(), see above
+    resample_quality='default', # key in resample_tiers, i.e. speed/quality tradeoff for resampling
+    offset=0.0,       # start reading this many seconds into the file
+    duration=None,    # only read this many seconds of audio. None = read to the end of the file
+    mono=False,       # downmix to mono (as a [1,n] tensor) at read time, i.e. before resampling
+    decoder=None,     # key in decoders to use. None = go by get_decoder_prefs()
     )->torch.tensor:
     "loads an audio file as a torch tensor"
-    global pdlbd_exts
-    
-    if '.mp3' in filename.lower():  # don't rely on torchaudio for mp3s
-        pdlbd_exts = get_supported_read_formats() if pdlbd_exts==None else pdlbd_exts
-        if '.mp3' in pdlbd_exts:   # first try pedalboard's mp3 support
-            with AudioFile(filename) as f:
-                audio, in_sr = f.read(f.frames), f.samplerate
+    with stage_stats.time('decode') as counts:
+        if decoder is not None: 
+            audio, in_sr = decoders[decoder](filename, offset=offset, duration=duration)
         else:
-            if verbose: print("Warning: pedalboard mp3 support failed, falling back to librosa")
-            audio, in_sr = lr_load(filename, mono=False, sr=sr)
-        audio = torch.tensor(audio)
-    else:
-        audio, in_sr = torchaudio.load(filename)
+            prefs = get_decoder_prefs()
+            names = prefs.get(os.path.splitext(filename)[1].lower(), prefs[''])
+            for i, name in enumerate(names):
+                try:
+                    audio, in_sr = decoders[name](filename, offset=offset, duration=duration)
+                    break
+                except Exception as e:
+                    if i == len(names)-1: raise
+                    if verbose: print(f"Warning: {name} failed to read {filename} ({e}), falling back to {names[i+1]}")
+        counts['audio_secs'] = audio.shape[-1] / in_sr
+        if offset == 0 and duration is None: counts['read'] = os.path.getsize(filename)   # bytes, only counted for whole files
+    if mono and len(audio.shape) > 1: audio = audio.mean(dim=0, keepdim=True)
     if in_sr != sr:
         if verbose: print(f"Resampling {filename} from {in_sr} Hz to {sr} Hz",flush=True)
-        resample_tf = T.Resample(in_sr, sr)
-        audio = resample_tf(audio)
+        with stage_stats.time('resample'):
+            resample_tf = get_resampler(in_sr, sr, dtype=audio.dtype, quality=resample_quality)
+            audio = resample_tf(audio)
         
     if norm in ['global','channel']: audio = normalize_audio(audio, norm=norm)
     return audio
 
-# %% ../00_core.ipynb 29
+# %% ../00_core.ipynb 39
+def get_audio_info(
+    filename:str,     # name of audio file
+    )->dict:
+    "reads only the header of an audio file, returns its sample rate, length in frames, number of channels & codec"
+    global pdlbd_exts
+    if '.mp3' in filename.lower():
+        pdlbd_exts = get_supported_read_formats() if pdlbd_exts==None else pdlbd_exts
+        if '.mp3' in pdlbd_exts:
+            with AudioFile(filename) as f:
+                return {'sr':int(f.samplerate), 'frames':int(f.frames), 'channels':int(f.num_channels), 'codec':'MP3'}
+    info = torchaudio.info(filename)
+    return {'sr':info.sample_rate, 'frames':info.num_frames, 'channels':info.num_channels, 'codec':info.encoding}
+
+# %% ../00_core.ipynb 43
+class StreamingResampler():
+    "stateful version of get_resampler: feed it consecutive blocks of audio, get out consecutive blocks of resampled audio"
+    def __init__(self, 
+        in_sr:int,                    # input sample rate
+        out_sr:int,                   # output sample rate
+        dtype=torch.float32,          # dtype of audio to resample
+        quality='default',            # key in resample_tiers
+        ):
+        self.passthru = (in_sr == out_sr)
+        if self.passthru: return
+        tf = get_resampler(in_sr, out_sr, dtype=dtype, quality=quality)
+        self.kernel, self.width = tf.kernel, tf.width
+        self.orig, self.new = tf.orig_freq // tf.gcd, tf.new_freq // tf.gcd
+        self.buf, self.n_in, self.n_out = None, 0, 0   # buf holds input that later outputs still need
+
+    def _run(self, final=False):
+        "resample as much of the buffer as we can, keep what's still needed"
+        ksize = self.kernel.shape[-1]   # = 2*width + orig
+        if self.buf.shape[-1] < ksize: return self.buf[:, :0]
+        n_frames = (self.buf.shape[-1] - ksize) // self.orig + 1
+        used = self.buf[:, :(n_frames-1)*self.orig + ksize]
+        if n_frames < 64:  # torch can use a different conv algorithm for tiny inputs, which rounds differently. pad so it doesn't
+            used = F.pad(used, (0, (64 - n_frames)*self.orig))
+        out = F.conv1d(used[:, None], self.kernel, stride=self.orig).transpose(1, 2).reshape(self.buf.shape[0], -1)[:, :n_frames*self.new]
+        self.buf = self.buf[:, n_frames*self.orig:]
+        if final: out = out[:, :max(0, math.ceil(self.new*self.n_in/self.orig) - self.n_out)]  # same length as one-shot
+        self.n_out += out.shape[-1]
+        return out
+
+    def __call__(self, 
+        x:torch.tensor,    # next block of audio, shape (c, n)
+        )->torch.tensor:
+        "returns as much resampled audio as can be computed so far. might be empty"
+        if self.passthru: return x
+        if self.buf is None: self.buf = x.new_zeros((x.shape[0], self.width))  # same zero padding as the one-shot version
+        self.buf, self.n_in = torch.cat([self.buf, x], dim=-1), self.n_in + x.shape[-1]
+        return self._run()
+
+    def flush(self)->torch.tensor:
+        "call after the last block, to get the remaining output"
+        if self.passthru or self.buf is None: return torch.zeros(0)
+        self.buf = torch.cat([self.buf, self.buf.new_zeros((self.buf.shape[0], self.width + self.orig))], dim=-1)
+        return self._run(final=True)
+
+def _iter_decoded_blocks(filename, n):
+    "yields blocks of n frames from filename, decoded as they're needed, by the preferred decoder that can do that"
+    global pdlbd_exts
+    pdlbd_exts = get_supported_read_formats() if pdlbd_exts==None else pdlbd_exts
+    ext, prefs = os.path.splitext(filename)[1].lower(), get_decoder_prefs()
+    names = [{'torchaudio':'soundfile'}.get(k, k) for k in prefs.get(ext, prefs[''])]  # soundfile decodes the same as torchaudio
+    for name in [k for k in names if k in ['soundfile','pedalboard']] + ['soundfile','pedalboard']:
+        if name == 'pedalboard' and ext in pdlbd_exts:
+            with AudioFile(filename) as f:
+                while f.tell() < f.frames: yield torch.from_numpy(f.read(n))
+            return
+        if name == 'soundfile':
+            import soundfile as sf
+            try: f = sf.SoundFile(filename)
+            except Exception: continue   # format soundfile can't read
+            with f:
+                for block in f.blocks(blocksize=n, dtype='float32', always_2d=True): yield torch.from_numpy(block.T.copy())
+            return
+    raise ValueError(f"Can't stream {filename}: neither soundfile nor pedalboard can read it")
+
+def stream_audio(
+    filename:str,       # name of file to read
+    sr=48000,           # sample rate to resample to
+    block_size=2**18,   # number of frames (at sr) in each block yielded. the last one can be shorter
+    mono=False,         # downmix to mono before resampling
+    resample_quality='default', # key in resample_tiers
+    stage=None,         # if given, stage_stats name for all of this read's time, without counting bytes read or audio_secs. e.g. for an extra pass over a file
+    ):
+    "yields consecutive (channels, block_size) tensors of resampled audio, without ever loading the whole file"
+    in_sr = get_audio_info(filename)['sr']
+    resampler = StreamingResampler(in_sr, sr, quality=resample_quality)
+    pending, n_pending = [], 0
+    blocks = _iter_decoded_blocks(filename, max(1, block_size*in_sr//sr))
+    decode_stage, resample_stage = ('decode', 'resample') if stage is None else (stage, stage)
+    if stage is None: stage_stats.add('decode', read=os.path.getsize(filename))
+    while True:
+        with stage_stats.time(decode_stage) as counts:
+            audio = next(blocks, None)
+            if audio is not None and stage is None: counts['audio_secs'] = audio.shape[-1] / in_sr
+        if audio is None: break
+        if mono: audio = audio.mean(dim=0, keepdim=True)
+        with stage_stats.time(resample_stage): out = resampler(audio)
+        pending.append(out); n_pending += out.shape[-1]
+        while n_pending >= block_size:
+            rest = torch.cat(pending, dim=-1)
+            yield rest[:, :block_size]
+            pending, n_pending = [rest[:, block_size:]], n_pending - block_size
+    if len(pending) == 0: return   # empty file
+    with stage_stats.time(resample_stage): tail = resampler.flush().reshape(pending[0].shape[0], -1)
+    rest = torch.cat(pending + [tail], dim=-1)
+    for start in range(0, rest.shape[-1], block_size): yield rest[:, start:start+block_size]
+
+# %% ../00_core.ipynb 46
+_load_audio_defaults = {k: p.default for k, p in inspect.signature(load_audio).parameters.items()}
+
+class AudioCache():
+    "on-disk cache of decoded & resampled audio, stored as memory-mappable numpy arrays"
+    def __init__(self, 
+        cache_dir:str,         # where to keep the cached arrays. can be shared between runs
+        max_gb=50.0,           # size budget. least-recently-used entries get deleted to stay under it
+        dtype='float16',       # storage type: 'float16' or 'int16' (int16 clips to [-1,1])
+        low_water=0.9,         # when over budget, evict down to this fraction of it, so eviction's directory scan happens rarely
+        ):
+        assert dtype in ['float16', 'int16'], f"AudioCache: unsupported dtype {dtype}"
+        self.cache_dir, self.max_bytes, self.dtype, self.low_water = cache_dir, int(max_gb*1e9), dtype, low_water
+        os.makedirs(cache_dir, exist_ok=True)
+        self.n_bytes = sum(e.stat().st_size for e in self._entries())
+
+    def _entries(self):
+        for sub in os.scandir(self.cache_dir):
+            if sub.is_dir(): yield from (e for e in os.scandir(sub.path) if e.name.endswith('.npy'))
+
+    def key(self, filename, sr, mono, **kwargs):
+        "cache key for this version of this file, at this sr & channel policy, and with any other load_audio options"
+        st = os.stat(filename)
+        s = f'{os.path.abspath(filename)}|{st.st_size}|{st.st_mtime_ns}|{sr}|{mono}|{self.dtype}'
+        opts = {k: v for k, v in kwargs.items() if k != 'verbose' and v != _load_audio_defaults.get(k)}  # all but verbose change the audio
+        if opts: s += '|' + '|'.join(f'{k}={opts[k]!r}' for k in sorted(opts))  # defaults left out, so they match plain calls
+        return hashlib.sha1(s.encode()).hexdigest()
+
+    def cache_file(self, filename, sr=48000, mono=False, **kwargs):
+        "where the cached array for filename lives (whether or not it exists yet)"
+        key = self.key(filename, sr, mono, **kwargs)
+        return os.path.join(self.cache_dir, key[:2], key+'.npy')
+
+    def evict(self):
+        "delete least recently used entries until we're down to low_water of the size budget"
+        entries = sorted(self._entries(), key=lambda e: e.stat().st_mtime)
+        self.n_bytes = sum(e.stat().st_size for e in entries)
+        for e in entries:
+            if self.n_bytes <= self.max_bytes * self.low_water: break
+            try: 
+                size = e.stat().st_size
+                os.remove(e.path)
+                self.n_bytes -= size
+            except FileNotFoundError: pass  # another process got it first
+
+    def __call__(self, 
+        filename:str,  # audio file to read
+        sr=48000,      # sample rate to resample to, as in load_audio
+        mono=False,    # downmix to mono, as in load_audio
+        **kwargs,      # other args to pass to load_audio on a cache miss
+        )->torch.tensor:
+        "like load_audio, but only decodes on a cache miss"
+        cache_file = self.cache_file(filename, sr, mono, **kwargs)
+        try:
+            arr = np.load(cache_file, mmap_mode='r')
+            os.utime(cache_file)    # mark as recently used
+        except (FileNotFoundError, ValueError):  # ValueError = partial/corrupt file
+            audio = load_audio(filename, sr=sr, mono=mono, **kwargs).cpu()
+            arr = audio.numpy().astype(np.float16) if self.dtype=='float16' else \
+                (audio.clamp(-1,1).numpy()*32767).round().astype(np.int16)
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+            with open(tmp_file, 'wb') as f: np.save(f, arr)
+            os.replace(tmp_file, cache_file)
+            self.n_bytes += os.path.getsize(cache_file)
+            if self.n_bytes > self.max_bytes: self.evict()
+            return audio
+        audio = torch.from_numpy(arr.astype(np.float32))
+        return audio if self.dtype=='float16' else audio/32767
+
+# %% ../00_core.ipynb 49
 def get_dbmax(
     audio,       # torch tensor of (multichannel) audio
     ):
     "finds the loudest value in the entire clip and puts that into dB (full scale)"
     return 20*torch.log10(torch.flatten(audio.abs()).max()).cpu().numpy()
 
-# %% ../00_core.ipynb 32
+# %% ../00_core.ipynb 52
 def audio_float_to_int(waveform):
     "converts torch float to numpy int16 (for playback in notebooks)"
     return np.clip( waveform.cpu().numpy()*32768 , -32768, 32768).astype('int16')
 
-# %% ../00_core.ipynb 34
+# %% ../00_core.ipynb 54
 def is_silence(
     audio,       # torch tensor of (multichannel) audio
     thresh=-60,  # threshold in dB below which we declare to be silence
@@ -112,20 +439,77 @@ def is_silence(
     dBmax = get_dbmax(audio)
     return dBmax < thresh
 
-# %% ../00_core.ipynb 38
+# %% ../00_core.ipynb 58
 def batch_it_crazy(
     x,        # a time series as a PyTorch tensor, e.g. stereo or mono audio
     win_len,  # length of each "window", i.e. length of each element in new batch
+    hop_len=None, # spacing between window starts. None = non-overlapping windows, as originally
+    pad=True,     # (with hop_len) zero-pad the end so the last window fits. False = drop leftovers, never copies
     ):
     "(pun intended) Chop up long sequence into a batch of win_len windows"
     if len(x.shape) < 2: x = x.unsqueeze(0)  # guard against 1-d arrays
     x_len = x.shape[-1]
-    n_windows = (x_len // win_len) + 1
-    pad_amt = win_len * n_windows - x_len  # pad end w. zeros to make lengths even when split
-    xpad = F.pad(x, (0, pad_amt))
-    return rearrange(xpad, 'd (b n) -> b d n', n=win_len)
+    if hop_len is None:
+        n_windows = (x_len // win_len) + 1
+        pad_amt = win_len * n_windows - x_len  # pad end w. zeros to make lengths even when split
+        xpad = F.pad(x, (0, pad_amt))
+        return rearrange(xpad, 'd (b n) -> b d n', n=win_len)
+    if not pad and x_len < win_len: return x.new_zeros(0, x.shape[0], win_len)  # not even one whole window
+    n_windows = max(1, math.ceil((x_len - win_len) / hop_len) + 1)
+    pad_amt = (n_windows - 1) * hop_len + win_len - x_len
+    if pad and pad_amt > 0: x = F.pad(x, (0, pad_amt))  # only copy if the end doesn't line up
+    return x.unfold(-1, win_len, hop_len).transpose(0, 1)  # strided view, shape (b, d, n)
+
+# %% ../00_core.ipynb 65
+def unbatch_it_crazy(
+    batch,            # batch of windows, shape (b, d, n), e.g. from batch_it_crazy
+    hop_len=None,     # spacing between window starts. None = non-overlapping
+    length=None,      # trim output to this length, e.g. the original length before batch_it_crazy
+    window='hann',    # 'hann' crossfades overlapping windows; None = plain average
+    block_size=256,   # how many windows to overlap-add at once; bounds the temporary memory used
+    ):
+    "(un-pun intended) overlap-add a batch of windows back into one long (d, length) sequence"
+    b, d, n = batch.shape
+    hop_len = n if hop_len is None else hop_len
+    out_len = (b - 1) * hop_len + n
+    w = torch.ones(n, dtype=batch.dtype, device=batch.device) if window is None \
+        else torch.hann_window(n+2, periodic=False, dtype=batch.dtype, device=batch.device)[1:-1]  # no zeros at edges
+    out = batch.new_zeros(d, out_len)
+    wsum = batch.new_zeros(1, out_len)
+    for start in range(0, b, block_size):
+        frames = batch[start:start+block_size] * w     # (k, d, n)
+        k = frames.shape[0]
+        seg_len, seg_start = (k - 1) * hop_len + n, start * hop_len
+        fold = lambda y, c: F.fold(y.permute(1,2,0).reshape(1, c*n, k), output_size=(1, seg_len), 
+                                   kernel_size=(1, n), stride=(1, hop_len)).reshape(c, seg_len)
+        out[:, seg_start:seg_start+seg_len] += fold(frames, d)
+        wsum[:, seg_start:seg_start+seg_len] += fold(w.expand(k, 1, n), 1)
+    out = out / torch.where(wsum > 0, wsum, torch.ones_like(wsum))   # hop_len > n leaves gaps, which stay zero
+    return out if length is None else out[:, :length]
+
+# %% ../00_core.ipynb 68
+def batch_db(
+    audio,            # torch tensor, either a batch (b, c, n) or, with block_size, a long (c, n) or (n) signal
+    block_size=None,  # if given, split a long signal into blocks of this many samples
+    hop_len=None,     # spacing between block starts. None = block_size, i.e. non-overlapping
+    mode='peak',      # 'peak' = max absolute value, 'rms' = root-mean-square
+    ):
+    "dB (full scale) for each clip in a batch, or for each block of a long signal. silence comes out as -inf"
+    if block_size is not None:
+        audio = batch_it_crazy(audio, block_size, hop_len=block_size if hop_len is None else hop_len)
+    dims = tuple(range(1, len(audio.shape)))  # everything but the batch dimension
+    if 'rms' == mode: return 10*torch.log10((audio.float()**2).mean(dim=dims))
+    return 20*torch.log10(torch.maximum(audio.amax(dim=dims), -audio.amin(dim=dims)).float())
+
+def batch_is_silence(
+    audio,       # torch tensor, batch (b, c, n) or a long signal with block_size given
+    thresh=-60,  # threshold in dB below which we declare to be silence
+    **kwargs,    # passed to batch_db, e.g. block_size, hop_len, mode
+    ):
+    "boolean mask of which clips (or blocks) are 'silence' below some dB threshold"
+    return batch_db(audio, **kwargs) < thresh
 
-# %% ../00_core.ipynb 45
+# %% ../00_core.ipynb 71
 def makedir(
     path:str,              # directory or nested set of directories
     ):
@@ -137,46 +521,604 @@ def makedir(
     except:                # don't really care about errors
         pass
 
-# %% ../00_core.ipynb 47
-def fast_scandir(
-    dir:str,  # top-level directory at which to begin scanning
-    ext:list  # list of allowed file extensions
+# %% ../00_core.ipynb 73
+def iter_scan_dirs(
+    paths,               # top-level directory (or list of them) at which to begin scanning
+    ext:list,            # list of allowed file extensions
+    workers=None,        # number of threads listing directories in parallel. None = ThreadPoolExecutor default
+    manifest_file=None,  # json file of cached directory listings. directories whose mtime hasn't changed aren't re-listed
+    errors=None,         # optional list, to which (path, error) tuples get appended for anything skipped
     ):
-    "very fast `glob` alternative. from https://stackoverflow.com/a/59803793/4259243"
-    subfolders, files = [], []
+    "parallel, iterative directory scan. yields (directory, matching files) for each directory as soon as it's listed"
+    if isinstance(paths, str): paths = [paths]
     ext = ['.'+x if x[0]!='.' else x for x in ext]  # add starting period to extensions if needed
-    try: # hope to avoid 'permission denied' by this try
-        for f in os.scandir(dir):
-            try: # 'hope to avoid too many levels of symbolic links' error
-                if f.is_dir():
-                    subfolders.append(f.path)
-                elif f.is_file():
-                    if os.path.splitext(f.name)[1].lower() in ext:
-                        files.append(f.path)
-            except:
-                pass 
-    except:
-        pass
+    manifest = {}
+    if manifest_file is not None:
+        try:
+            with open(manifest_file) as f: manifest = json.load(f)
+        except (OSError, ValueError): pass   # missing or unreadable: just scan everything
+
+    def list_dir(d):  # returns id of the real directory, [mtime, subdir names, file names], and errors
+        st = os.stat(d)  # follows symlinks, so (st_dev, st_ino) tells us if we've already been here
+        cached = manifest.get(d)
+        if cached is not None and cached[0] == st.st_mtime: return (st.st_dev, st.st_ino), cached, []
+        dirs, fnames, errs = [], [], []
+        with os.scandir(d) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(): dirs.append(entry.name)
+                    elif entry.is_file(): fnames.append(entry.name)
+                except OSError as e:     # e.g. 'too many levels of symbolic links'
+                    errs.append((entry.path, repr(e)))
+        return (st.st_dev, st.st_ino), [st.st_mtime, dirs, fnames], errs
+
+    errors = [] if errors is None else errors
+    seen, new_manifest = set(), {}
+    frontier, roots = list(paths), set(paths)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while frontier:  # breadth-first: list all dirs at one depth in parallel, then go one level deeper
+            futures = [executor.submit(list_dir, d) for d in frontier]
+            next_frontier = []
+            for d, future in zip(frontier, futures):
+                try:
+                    dir_id, listing, errs = future.result()
+                except OSError as e:  # e.g. 'permission denied'
+                    errors.append((d, repr(e)))
+                    continue
+                errors.extend(errs)
+                if dir_id in seen:
+                    errors.append((d, 'directory already scanned, e.g. symlink loop'))
+                    continue
+                seen.add(dir_id)
+                new_manifest[d] = listing
+                _, dirs, fnames = listing
+                yield d, [os.path.join(d, f) for f in fnames if os.path.splitext(f)[1].lower() in ext]
+                next_frontier.extend(os.path.join(d, s) for s in dirs)
+            frontier = next_frontier
+
+    if manifest_file is not None:  # keep entries for other trees, replace the ones we just scanned
+        tops = [p.rstrip('/')+'/' for p in paths]
+        manifest = {k:v for k,v in manifest.items() if (k not in roots) and not any(k.startswith(t) for t in tops)}
+        manifest.update(new_manifest)
+        tmp_file = f'{manifest_file}.{os.getpid()}.tmp'   # each process its own, e.g. when every rank scans at startup
+        with open(tmp_file, 'w') as f: json.dump(manifest, f)
+        os.replace(tmp_file, manifest_file)
+
+def scan_dirs(
+    paths,    # top-level directory (or list of them) at which to begin scanning
+    ext:list, # list of allowed file extensions
+    **kwargs, # passed to iter_scan_dirs
+    ):
+    "parallel, iterative directory scan. returns subfolders, files, and a list of (path, error) for anything skipped"
+    roots = [paths] if isinstance(paths, str) else paths
+    subfolders, files, errors = [], [], []
+    for d, dir_files in iter_scan_dirs(paths, ext, errors=errors, **kwargs):
+        if d not in roots: subfolders.append(d)
+        files.extend(dir_files)
+    return subfolders, files, errors
 
-    for dir in list(subfolders):
-        sf, f = fast_scandir(dir, ext)
-        subfolders.extend(sf)
-        files.extend(f)
+# %% ../00_core.ipynb 74
+def fast_scandir(
+    dir:str,  # top-level directory at which to begin scanning
+    ext:list, # list of allowed file extensions
+    **kwargs, # passed to scan_dirs
+    ):
+    "very fast `glob` alternative. originally from https://stackoverflow.com/a/59803793/4259243, now a wrapper for scan_dirs"
+    subfolders, files, errors = scan_dirs(dir, ext, **kwargs)
+    if errors: warnings.warn(f"fast_scandir: skipped {len(errors)} path(s) in {dir}, e.g. {errors[0]}")
     return subfolders, files
 
-# %% ../00_core.ipynb 51
+# %% ../00_core.ipynb 78
+audio_exts = ['.wav','.flac','.ogg','.aiff','.aif','.mp3']
+
+def iter_audio_filenames(
+    paths:list,          # directories in which to search (individual audio files are fine too)
+    manifest_file=None,  # optional json file for caching directory listings between runs, see scan_dirs
+    workers=None,        # number of threads for scanning
+    ):
+    "generator version of get_audio_filenames: yields filenames as soon as their directory has been listed"
+    if type(paths) is str: paths = [paths]
+    yield from (p for p in paths if os.path.isfile(p) and os.path.splitext(p)[1].lower() in audio_exts)
+    dirs = [p for p in paths if not os.path.isfile(p)]
+    if not dirs: return
+    errors = []
+    for d, files in iter_scan_dirs(dirs, audio_exts, workers=workers, manifest_file=manifest_file, errors=errors):
+        yield from files
+    if errors: warnings.warn(f"get_audio_filenames: skipped {len(errors)} path(s), e.g. {errors[0]}")
+
 def get_audio_filenames(
-    paths:list   # directories in which to search
+    paths:list,          # directories in which to search (individual audio files are fine too)
+    **kwargs,            # passed to iter_audio_filenames, e.g. manifest_file, workers
     ):
     "recursively get a list of audio filenames"
-    filenames = []
-    if type(paths) is str: paths = [paths]
-    for path in paths:               # get a list of relevant filenames
-        subfolders, files = fast_scandir(path, ['.wav','.flac','.ogg','.aiff','.aif','.mp3'])
-        filenames.extend(files)
-    return filenames
+    return list(iter_audio_filenames(paths, **kwargs))
 
-# %% ../00_core.ipynb 54
+# %% ../00_core.ipynb 82
+_worker_func = None   # what stream_map's workers call. set once per worker, so func (and e.g. the args it carries) isn't pickled into every task
+
+def _init_worker(func, runtime=None):
+    global _worker_func
+    if runtime is not None: runtime.setup()
+    _worker_func = func
+
+def _call_worker(item): return _worker_func(item)
+
+def _call_worker_batch(batch): return [_worker_func(item) for item in batch]
+
+def stream_map(
+    func,             # function to call on each item, in a worker process
+    items,            # iterable of items, e.g. a generator. consumed lazily
+    max_workers=None, # number of worker processes. None = cpu_count(), or runtime.workers
+    chunksize=1,      # how many items to send to a worker at a time
+    callback=None,    # called (in this process) on each result as soon as it arrives, e.g. to record progress
+    batched=False,    # items are lists of items, e.g. from size_batches. results, callback & progress are still per item
+    runtime=None,     # a WorkerRuntime, to set the number of threads per worker (& CPU pinning)
+    keep_results=True,# False = don't hold on to the results (e.g. when callback has dealt with them), & return None
+    **kwargs,         # passed to tqdm, e.g. desc, unit, total
+    ):
+    "like tqdm's process_map, but for iterables of unknown length. results are returned in order of completion"
+    results = []
+    if max_workers is None and runtime is not None: max_workers = runtime.workers
+    with Pool(processes=max_workers, initializer=_init_worker, initargs=(func, runtime)) as p, tqdm(**kwargs) as pbar:
+        for r in p.imap_unordered(_call_worker_batch if batched else _call_worker, items, chunksize=chunksize):
+            for r in (r if batched else [r]):
+                if callback is not None: callback(r)
+                if keep_results: results.append(r)
+                pbar.update(1)
+    return results if keep_results else None
+
+# %% ../00_core.ipynb 87
+index_cols = {'size':np.int64, 'mtime':np.float64, 'frames':np.int64, 'sr':np.int32, 'channels':np.int16, 'codec':str}
+
+def _probe_file(filename):
+    "stat & read the header of one file for build_audio_index. frames = -1 means we couldn't read it"
+    st = os.stat(filename)
+    try:
+        info = get_audio_info(filename)
+        return st.st_size, st.st_mtime, info['frames'], info['sr'], info['channels'], info['codec']
+    except Exception:
+        return st.st_size, st.st_mtime, -1, 0, 0, ''
+
+def load_audio_index(
+    index_file:str,   # .npz file written by build_audio_index
+    )->dict:
+    "reads an audio index: a dict with a list of paths & numpy arrays for the other columns"
+    with np.load(index_file) as data:
+        index = {k: data[k] for k in index_cols.keys()}
+        index['path'] = data['path'].tobytes().decode('utf-8').split('\n') if len(data['path']) > 0 else []
+    return index
+
+_bad_index_errors = (OSError, ValueError, EOFError, KeyError, zipfile.BadZipFile)  # what a missing, partial or foreign index file raises
+
+def save_audio_index(
+    index:dict,       # dict of columns as returned by build_audio_index
+    index_file:str,   # where to write it, should end in .npz
+    ):
+    "writes an audio index to disk. paths are stored as one utf-8 blob to keep things compact"
+    tmp_file = f'{index_file}.{os.getpid()}.tmp.npz'   # write then rename, so readers never see a partial file. one per process, e.g. DDP ranks
+    cols = {k: np.asarray(index[k], dtype=v) for k, v in index_cols.items()}
+    np.savez(tmp_file, path=np.frombuffer('\n'.join(index['path']).encode('utf-8'), dtype=np.uint8), **cols)
+    os.replace(tmp_file, index_file)
+
+def build_audio_index(
+    paths:list,           # directories (or list of them) in which to search for audio files
+    index_file=None,      # if given, existing index is updated (and saved) here
+    workers=None,         # number of parallel processes for reading headers. None = cpu_count()
+    verbose=False,        # print progress info
+    )->dict:
+    "scans paths for audio files, reads headers of new or changed files, returns (& optionally saves) the index"
+    filenames = get_audio_filenames(paths)
+    old = {}
+    if index_file is not None and os.path.exists(index_file):
+        try: 
+            prev = load_audio_index(index_file)
+            old = {p: i for i, p in enumerate(prev['path'])}
+        except _bad_index_errors as e: 
+            if verbose: print(f"build_audio_index: can't read {index_file} ({e!r}), rebuilding it from scratch")
+    rows, to_probe = [None]*len(filenames), []
+    for i, filename in enumerate(filenames):
+        j = old.get(filename)
+        if j is not None:
+            st = os.stat(filename)
+            if st.st_size == prev['size'][j] and st.st_mtime == prev['mtime'][j]:  # unchanged: reuse old row
+                rows[i] = tuple(prev[k][j] for k in index_cols.keys())
+                continue
+        to_probe.append(i)
+    if verbose: print(f"build_audio_index: {len(filenames)} files, {len(to_probe)} new or changed")
+    if len(to_probe) > 0:
+        with Pool(processes=workers or cpu_count()) as p:
+            probed = p.map(_probe_file, [filenames[i] for i in to_probe], chunksize=64)
+        for i, row in zip(to_probe, probed): rows[i] = row
+    index = {'path': filenames}
+    for c, (k, v) in enumerate(index_cols.items()):
+        index[k] = np.array([r[c] for r in rows], dtype=v)
+    if index_file is not None: save_audio_index(index, index_file)
+    return index
+
+def get_audio_index(
+    paths:list,           # directories in which to search, only used if the index has to be (re)built
+    index_file:str,       # .npz file for the index
+    update=False,         # True = rescan paths & update index; False = just load index_file if it exists
+    **kwargs,             # passed to build_audio_index
+    )->dict:
+    "quick way to get an index: loads index_file if there is one (that can be read), otherwise builds it"
+    if os.path.exists(index_file) and not update: 
+        try: return load_audio_index(index_file)
+        except _bad_index_errors: pass   # e.g. left half-written by an older version: build it again
+    return build_audio_index(paths, index_file=index_file, **kwargs)
+
+def get_shared_audio_index(
+    paths:list,           # as for get_audio_index
+    index_file:str,       # .npz file for the index, visible to all shards
+    shard_index=0,        # which shard of the job this is, e.g. from shard_spec
+    num_shards=1,         # how many shards in all
+    poll_secs=10,         # how often the other shards check whether the index is there yet
+    **kwargs,             # passed to get_audio_index
+    )->dict:
+    """get_audio_index for jobs split into shards: only shard 0 builds a missing index, while the others wait for it. 
+    so the corpus gets scanned once, not once per shard, and every shard sees the same list in the same order"""
+    if num_shards <= 1 or shard_index == 0: return get_audio_index(paths, index_file, **kwargs)
+    waited = False
+    while True:   # save_audio_index renames the finished file into place, so once it's there it's whole
+        try: return load_audio_index(index_file)
+        except _bad_index_errors: pass
+        if not waited: print(f"Shard {shard_index}: waiting for shard 0 to build the index {index_file}", flush=True)
+        waited = True
+        time.sleep(poll_secs)
+
+# %% ../00_core.ipynb 90
+def size_batches(
+    items:list,       # items to schedule, e.g. filenames
+    sizes,            # size of each item, e.g. bytes or seconds of audio
+    min_batch=0,      # group items smaller than this together, into batches of about this total size
+    )->list:
+    "sorts items biggest-first, and batches up the small ones. returns a list of lists of items"
+    sizes = np.asarray(sizes)
+    batches, batch, total = [], [], 0
+    for i in np.argsort(-sizes, kind='stable'):
+        batch.append(items[i])
+        total += sizes[i]
+        if total >= min_batch: 
+            batches.append(batch)
+            batch, total = [], 0
+    if batch: batches.append(batch)
+    return batches
+
+def index_durations(
+    index:dict,       # an audio index, e.g. from get_audio_index
+    )->np.ndarray:
+    "length of each file in the index in seconds, 0 for ones whose header couldn't be read"
+    return np.where(index['frames'] >= 0, index['frames'] / np.maximum(index['sr'], 1), 0.0)
+
+# %% ../00_core.ipynb 93
+thread_env_vars = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+def available_cpus() -> list:
+    "the CPUs this process may run on, e.g. as limited by SLURM or taskset. cpu_count() can be many more"
+    try: return sorted(os.sched_getaffinity(0))
+    except AttributeError: return list(range(cpu_count()))  # not available on macOS or Windows
+
+class WorkerRuntime():
+    "how many worker processes to run, with how many threads each, and optionally which CPUs they're pinned to"
+    def __init__(self, 
+        workers=None, # number of worker processes. None = as many as fit, given threads
+        threads=None, # torch/OpenMP/MKL threads per worker. None = share the CPUs out evenly, or 1 if workers is None too
+        pin=False,    # pin each worker to its own block of `threads` CPUs
+        cpus=None,    # CPUs to use. None = available_cpus()
+        ):
+        self.cpus = list(cpus) if cpus is not None else available_cpus()
+        if workers is None and threads is None: threads = 1
+        if workers is None: workers = max(1, len(self.cpus) // threads)
+        if threads is None: threads = max(1, len(self.cpus) // workers)
+        self.workers, self.threads, self.pin = workers, threads, pin
+
+    def __repr__(self): 
+        return f"WorkerRuntime(workers={self.workers}, threads={self.threads}, pin={self.pin}, {len(self.cpus)} CPUs)"
+
+    def worker_cpus(self, worker:int) -> list:
+        "the block of CPUs for the given worker number. wraps around if there are more workers*threads than CPUs"
+        return [self.cpus[(worker * self.threads + i) % len(self.cpus)] for i in range(self.threads)]
+
+    def setup(self, worker=None):
+        "call at the start of a worker process, e.g. as a Pool's initializer. worker number defaults to the one multiprocessing gave this process"
+        for var in thread_env_vars: os.environ[var] = str(self.threads)  # for libraries (and subprocesses) that read them later
+        torch.set_num_threads(self.threads)
+        if self.pin and hasattr(os, 'sched_setaffinity'):
+            if worker is None: worker = (current_process()._identity or (1,))[-1] - 1
+            os.sched_setaffinity(0, self.worker_cpus(worker % self.workers))
+
+# %% ../00_core.ipynb 96
+def shard_spec(
+    shard_index=None,  # which shard this is, 0...num_shards-1. None = from $SLURM_ARRAY_TASK_ID (minus $SLURM_ARRAY_TASK_MIN), or 0
+    num_shards=None,   # how many shards in all. None = $SLURM_ARRAY_TASK_COUNT, or 1
+    )->tuple:
+    "(shard_index, num_shards) for splitting work across nodes"
+    env = os.environ
+    if num_shards is None: num_shards = int(env.get('SLURM_ARRAY_TASK_COUNT', 1))
+    if shard_index is None: shard_index = int(env.get('SLURM_ARRAY_TASK_ID', 0)) - int(env.get('SLURM_ARRAY_TASK_MIN', 0))
+    if not 0 <= shard_index < num_shards: raise ValueError(f"shard_index = {shard_index} is not in 0...{num_shards-1}")
+    return shard_index, num_shards
+
+def hash_shard(
+    items,            # iterable of strings, e.g. filenames. can be a generator
+    shard_index=0,    # which shard to keep
+    num_shards=1,     # how many shards in all
+    ):
+    "yields just the items that belong in this shard, according to a stable hash of each"
+    for item in items:
+        if num_shards == 1 or int(hashlib.md5(item.encode('utf-8')).hexdigest()[:8], 16) % num_shards == shard_index: yield item
+
+def balanced_shard(
+    items:list,       # items to split up, e.g. filenames
+    sizes,            # size of each item, e.g. bytes or seconds of audio
+    shard_index=0,    # which shard to keep
+    num_shards=1,     # how many shards in all
+    )->list:
+    "this shard's items, out of a split into num_shards of about equal total size"
+    totals = [(0.0, s) for s in range(num_shards)]   # heap of (total size so far, shard)
+    mine = []
+    for i in np.argsort(-np.asarray(sizes), kind='stable'):
+        total, s = heapq.heappop(totals)
+        heapq.heappush(totals, (total + sizes[i], s))
+        if s == shard_index: mine.append(items[i])
+    return mine
+
+def shard_filename(
+    filename:str,     # e.g. output_path/chunkadelic_manifest.jsonl, of which each shard should have its own
+    shard_index=0,    # which shard
+    num_shards=1,     # how many shards in all
+    )->str:
+    "per-shard version of filename, e.g. chunkadelic_manifest.00003-of-00016.jsonl. unchanged when there's only one shard"
+    if num_shards == 1: return filename
+    stem, ext = os.path.splitext(filename)
+    return f'{stem}.{shard_index:05d}-of-{num_shards:05d}{ext}'
+
+def shard_files(
+    filename:str,     # the main file, e.g. output_path/chunkadelic_manifest.jsonl
+    )->list:
+    "the per-shard versions of filename (as named by shard_filename) that exist so far"
+    stem, ext = os.path.splitext(filename)
+    return sorted(glob.glob(f'{glob.escape(stem)}.*-of-*{ext}'))
+
+# %% ../00_core.ipynb 99
+class PipelineReport():
+    "adds up per-file stats from a pipeline's workers into a throughput report"
+    derived = ['wall_secs', 'audio_hours', 'bytes_read', 'bytes_written', 'files_per_sec', 'audio_hours_per_sec', 'MB_read_per_sec', 'MB_written_per_sec']
+    
+    def __init__(self, 
+        n_slowest=10,   # how many of the slowest files to keep track of
+        ):
+        self.n_slowest, self.start, self.wall_secs = n_slowest, time.time(), None
+        self.counts, self.stages, self.slowest = {}, {}, []   # slowest is a heap of (secs, path, audio_secs)
+        
+    def add(self, **counts):
+        "adds to the overall counts, e.g. skipped=1"
+        for k, v in counts.items(): self.counts[k] = self.counts.get(k, 0) + v
+            
+    def add_stages(self, stages:dict):
+        "adds stage totals, e.g. from StageStats.pop()"
+        for stage, counts in stages.items():
+            totals = self.stages.setdefault(stage, {})
+            for k, v in counts.items(): totals[k] = totals.get(k, 0) + v
+                
+    def add_file(self, 
+        path:str,       # the file
+        secs:float,     # how long it took
+        stages={},      # its stage totals
+        **counts,       # anything else to add up, e.g. chunks=
+        ):
+        self.add(files=1, secs=secs, **counts)
+        self.add_stages(stages)
+        entry = (secs, path, stages.get('decode', {}).get('audio_secs', 0))
+        if len(self.slowest) < self.n_slowest: heapq.heappush(self.slowest, entry)
+        else: heapq.heappushpop(self.slowest, entry)
+        
+    def to_dict(self)->dict:
+        "the report, with rates worked out over the wall-clock time so far (or, when merged, of the longest run)"
+        wall = max(self.wall_secs or time.time() - self.start, 1e-9)
+        total = lambda key: sum(s.get(key, 0) for s in self.stages.values())
+        stage_secs, audio_secs = max(total('secs'), 1e-9), total('audio_secs')
+        return {'wall_secs':wall, **self.counts, 'audio_hours':audio_secs/3600, 'bytes_read':total('read'), 'bytes_written':total('written'),
+                'files_per_sec':self.counts.get('files', 0)/wall, 'audio_hours_per_sec':audio_secs/3600/wall, 
+                'MB_read_per_sec':total('read')/2**20/wall, 'MB_written_per_sec':total('written')/2**20/wall,
+                'stages':{k: {**v, 'share':v.get('secs', 0)/stage_secs} for k, v in sorted(self.stages.items(), key=lambda kv: -kv[1].get('secs', 0))},
+                'slowest':[{'path':p, 'secs':s, 'audio_secs':a} for s, p, a in sorted(self.slowest, reverse=True)]}
+    
+    @classmethod
+    def from_dict(cls, d:dict, n_slowest=10):
+        "the inverse of to_dict"
+        report = cls(n_slowest=n_slowest)
+        report.wall_secs = d['wall_secs']
+        report.counts = {k: v for k, v in d.items() if k not in cls.derived + ['stages', 'slowest']}
+        report.stages = {k: {kk: vv for kk, vv in v.items() if kk != 'share'} for k, v in d['stages'].items()}
+        report.slowest = [(s['secs'], s['path'], s['audio_secs']) for s in d['slowest']]
+        heapq.heapify(report.slowest)
+        return report
+    
+    def summary(self)->str:
+        "a few lines for printing at the end of a run"
+        d = self.to_dict()
+        lines = [f"{d.get('files', 0)} file(s) in {d['wall_secs']:.1f} s: {d['files_per_sec']:.2f} files/s, {d['audio_hours_per_sec']*3600:.1f} s of audio/s, "
+                 f"read {d['bytes_read']/2**20:.1f} MB, wrote {d['bytes_written']/2**20:.1f} MB"]
+        lines += [f"  {k:12s} {v['share']*100:5.1f}%  {v.get('secs', 0):8.2f} s in {v.get('calls', 0)} call(s)" for k, v in d['stages'].items()]
+        if d['slowest']: lines.append(f"  slowest file: {d['slowest'][0]['path']} ({d['slowest'][0]['secs']:.2f} s)")
+        return '\n'.join(lines)
+    
+    def save(self, filename:str):
+        "writes the report as JSON, or as CSV (one row per stage, then one per slow file) if filename ends in .csv"
+        d = self.to_dict()
+        if not filename.lower().endswith('.csv'):
+            with open(filename, 'w') as f: json.dump(d, f, indent=1)
+            return
+        import csv
+        keys = sorted(set(k for v in d['stages'].values() for k in v))
+        with open(filename, 'w', newline='') as f:
+            w = csv.writer(f)
+            w.writerow(['totals'] + [k for k in d if k not in ['stages', 'slowest']])
+            w.writerow([''] + [v for k, v in d.items() if k not in ['stages', 'slowest']])
+            w.writerow(['stage'] + keys)
+            for k, v in d['stages'].items(): w.writerow([k] + [v.get(key, 0) for key in keys])
+            w.writerow(['slowest', 'secs', 'audio_secs'])
+            for s in d['slowest']: w.writerow([s['path'], s['secs'], s['audio_secs']])
+
+def merge_reports(
+    reports:list,   # dicts from PipelineReport.to_dict, e.g. one per node
+    )->dict:
+    "combines reports of runs that went on side by side: counts add up, the wall-clock time is the longest one's"
+    if not reports: return {}
+    merged = PipelineReport.from_dict(reports[0])
+    for d in reports[1:]:
+        r = PipelineReport.from_dict(d)
+        merged.add(**r.counts)
+        merged.add_stages(r.stages)
+        merged.wall_secs = max(merged.wall_secs, r.wall_secs)
+        merged.slowest = heapq.nlargest(merged.n_slowest, merged.slowest + r.slowest)
+    return merged.to_dict()
+
+def merge_report_files(
+    report_file:str,  # the main (JSON) report, e.g. output_path/chunkadelic_stats.json
+    )->dict:
+    "merges the per-shard reports (see shard_files) into report_file & removes them. returns the merged report, {} if there were none"
+    files, reports = shard_files(report_file), []
+    for f in files:
+        with open(f) as fp: reports.append(json.load(fp))
+    merged = merge_reports(reports)
+    if merged:
+        with open(report_file, 'w') as fp: json.dump(merged, fp, indent=1)
+        for f in files: os.remove(f)
+    return merged
+
+# %% ../00_core.ipynb 102
+def _decode_for_pack(sr, mono, dtype, filename):
+    try: audio = load_audio(filename, sr=sr, verbose=False, mono=mono).cpu()
+    except Exception as e:
+        warnings.warn(f"pack_corpus: skipping {filename}: {e}")
+        return None
+    if len(audio.shape) < 2: audio = audio.unsqueeze(0)
+    if dtype == 'int16': return (audio.clamp(-1,1).numpy()*32767).round().astype(np.int16)
+    return audio.numpy().astype(np.float16)
+
+def pack_corpus(
+    paths,              # directories (or list of them) of audio files to pack
+    prefix:str,         # output goes to {prefix}.bin and {prefix}.npz
+    sr=48000,           # sample rate to resample everything to
+    dtype='int16',      # storage type: 'int16' or 'float16'
+    mono=False,         # downmix everything to mono
+    workers=None,       # number of decoding processes. None = cpu_count()
+    ):
+    "decodes a corpus of audio files into one contiguous blob plus an offset/length index. returns the index"
+    assert dtype in ['int16', 'float16'], f"pack_corpus: unsupported dtype {dtype}"
+    filenames = get_audio_filenames(paths)
+    index = {'path': [], 'offset': [], 'length': [], 'channels': []}
+    pos = 0
+    with open(prefix + '.bin.tmp', 'wb') as f, Pool(processes=workers or cpu_count()) as p:
+        decoded = p.imap(partial(_decode_for_pack, sr, mono, dtype), filenames, chunksize=4)  # imap keeps file order
+        for filename, arr in zip(filenames, tqdm(decoded, total=len(filenames), unit='file')):
+            if arr is None: continue
+            f.write(np.ascontiguousarray(arr).tobytes())
+            for k, v in zip(index.keys(), [filename, pos, arr.shape[-1], arr.shape[0]]): index[k].append(v)
+            pos += arr.size
+    os.replace(prefix + '.bin.tmp', prefix + '.bin')
+    index = {'path': index['path'], 'offset': np.array(index['offset'], dtype=np.int64),
+             'length': np.array(index['length'], dtype=np.int64), 'channels': np.array(index['channels'], dtype=np.int16),
+             'sr': sr, 'dtype': dtype}
+    np.savez(prefix + '.tmp.npz', path=np.frombuffer('\n'.join(index['path']).encode('utf-8'), dtype=np.uint8),
+             **{k: index[k] for k in ['offset', 'length', 'channels', 'sr', 'dtype']})
+    os.replace(prefix + '.tmp.npz', prefix + '.npz')
+    return index
+
+def packed_to_float(
+    arr,  # numpy array (or view) of packed audio, int16 or float16
+    )->torch.tensor:
+    "converts (a slice of) packed audio to a float32 torch tensor"
+    scale = 1/32767 if arr.dtype == np.int16 else 1
+    return torch.from_numpy(np.asarray(arr, dtype=np.float32) * scale)
+
+class PackedCorpus():
+    "read-only access to a corpus written by pack_corpus, via np.memmap. item i is a (channels, length) view"
+    def __init__(self, 
+        prefix:str,   # same prefix given to pack_corpus
+        ):
+        self.prefix, self._data = prefix, None
+        with np.load(prefix + '.npz') as data:
+            self.paths = data['path'].tobytes().decode('utf-8').split('\n') if len(data['path']) > 0 else []
+            self.offset, self.length, self.channels = data['offset'], data['length'], data['channels']
+            self.sr, self.dtype = int(data['sr']), str(data['dtype'])
+
+    @property
+    def data(self):  # opened on first use, so each (forked/spawned) DataLoader worker gets its own map
+        if self._data is None: self._data = np.memmap(self.prefix + '.bin', dtype=self.dtype, mode='r')
+        return self._data
+
+    def __getstate__(self):  # don't pickle the memmap: that would copy the whole corpus
+        return {**self.__dict__, '_data': None}
+
+    def __len__(self): return len(self.paths)
+
+    def __getitem__(self, i):
+        start, c, n = self.offset[i], self.channels[i], self.length[i]
+        return self.data[start:start + c*n].reshape(c, n)
+
+# %% ../00_core.ipynb 105
+def bench_decoders(
+    paths,           # directories (or list of them) of audio files to sample from
+    n_files=5,       # how many files to time, per extension
+    names=None,      # list of keys in decoders to try. None = all of them
+    )->dict:
+    "times each decoder on a few files of each extension. returns {ext: {decoder: seconds per file, or None if it failed}}"
+    by_ext = {}
+    for filename in get_audio_filenames(paths):
+        by_ext.setdefault(os.path.splitext(filename)[1].lower(), []).append(filename)
+    results = {}
+    for ext, filenames in by_ext.items():
+        sample = random.sample(filenames, min(n_files, len(filenames)))
+        results[ext] = {}
+        for name in (names or decoders.keys()):
+            try:
+                decoders[name](sample[0])   # untimed warmup, so one-time imports & setup don't count
+                start = time.perf_counter()
+                for filename in sample: decoders[name](filename)
+                results[ext][name] = (time.perf_counter() - start)/len(sample)
+            except Exception:
+                results[ext][name] = None
+    return results
+
+def save_decoder_prefs(
+    results:dict,                      # output of bench_decoders
+    prefs_file:str=None,               # where to save. None = decoder_prefs_file
+    )->dict:
+    "turns benchmark results into per-extension orderings of working decoders (fastest first), and saves them"
+    prefs_file = prefs_file or decoder_prefs_file
+    prefs = {}
+    try:
+        with open(prefs_file) as f: prefs = json.load(f)  # keep prefs for extensions we didn't benchmark this time
+    except (OSError, ValueError): pass
+    for ext, times in results.items():
+        working = sorted([k for k, t in times.items() if t is not None], key=lambda k: times[k])
+        if working: prefs[ext] = working
+    os.makedirs(os.path.dirname(os.path.abspath(prefs_file)), exist_ok=True)
+    with open(prefs_file + '.tmp', 'w') as f: json.dump(prefs, f, indent=1)
+    os.replace(prefs_file + '.tmp', prefs_file)
+    if prefs_file == decoder_prefs_file: get_decoder_prefs(reload=True)
+    return prefs
+
+def bench_decode_main():
+    "command-line entry point for aeiou-bench-decode"
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="times each audio decoder on a sample of your files, and saves the fastest ones per file extension for load_audio to use")
+    parser.add_argument('--n_files', type=int, default=5, help='How many files of each extension to time')
+    parser.add_argument('--prefs_file', default=decoder_prefs_file, help='Where to save the preferences (see also env var AEIOU_DECODER_PREFS)')
+    parser.add_argument('--dry_run', action='store_true', help="Just print results, don't save them")
+    parser.add_argument('input_paths', nargs='+', help='Path(s) of a file or a folder of files. (recursive)')
+    args = parser.parse_args()
+    results = bench_decoders(args.input_paths, n_files=args.n_files)
+    for ext, times in results.items():
+        print(f"{ext}:  " + ",  ".join(f"{k} = {t*1000:.1f} ms" if t is not None else f"{k} failed" for k, t in times.items()))
+    if not args.dry_run:
+        prefs = save_decoder_prefs(results, args.prefs_file)
+        print(f"Saved to {args.prefs_file}: {prefs}")
+
+# %% ../00_core.ipynb 107
 def untuple(x, verbose=False):
     """Recursive.  For when you're sick of tuples and lists: 
     keeps peeling off elements until we get a non-tuple or non-list, 
@@ -188,15 +1130,105 @@ def untuple(x, verbose=False):
         if verbose: print("no: x = ",x)
         return x
 
-# %% ../00_core.ipynb 57
+# %% ../00_core.ipynb 110
+heavy_modules = ['wandb', 'umap', 'plotly', 'holoviews', 'panel', 'bokeh', 'pandas', 'librosa', 'scipy.signal',
+                 'webdataset', 'torchvision', 'matplotlib', 'IPython', 'accelerate']
+
+def import_benchmark(
+    module='aeiou.chunkadelic',  # name of module to import
+    heavy=heavy_modules,         # modules we'd rather not see loaded
+    runs=3,                      # number of fresh processes to try; the fastest time is reported
+    ):
+    "cold-start import time for module, in seconds, and which of the `heavy` modules it loaded"
+    code = (f"import time, sys, json; t = time.perf_counter(); import {module}; t = time.perf_counter() - t; "
+            f"print(json.dumps([t, [m for m in {heavy!r} if m in sys.modules]]))")
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        t, loaded = json.loads(out.strip().split('\n')[-1])
+        times.append(t)
+    return min(times), loaded
+
+# %% ../00_core.ipynb 113
+ckpt_index_name = 'ckpt_index.json'   # name of the registry file kept in each run root
+
+def _read_ckpt_index(root):
+    try:
+        with open(os.path.join(root, ckpt_index_name)) as f: return json.load(f)
+    except (OSError, ValueError): return []
+
+def register_ckpt(
+    ckpt_path,       # filename of checkpoint that was just written, e.g. {root}/{run_name}/checkpoints/x.ckpt
+    root,            # run root directory, i.e. what you'd pass to get_latest_ckpt as dir_tree
+    keep_last=None,  # if given, delete all but this many of the newest checkpoints from the same run
+    ):
+    "records a checkpoint in root's index, so get_latest_ckpt needn't search for it. call only on the main process"
+    rel = os.path.relpath(ckpt_path, root)
+    parts = Path(rel).parts
+    run = parts[-3] if len(parts) >= 3 else ''   # .../{run}/checkpoints/x.ckpt
+    entries = [e for e in _read_ckpt_index(root) if e['path'] != rel]
+    entries.append({'path': rel, 'run': run, 'time': os.path.getctime(ckpt_path)})
+    if keep_last is not None:
+        same_run = sorted([e for e in entries if e['run'] == run], key=lambda e: e['time'])
+        for e in same_run[:max(0, len(same_run) - keep_last)]:
+            try: os.remove(os.path.join(root, e['path']))
+            except FileNotFoundError: pass
+            entries.remove(e)
+    tmp_file = os.path.join(root, ckpt_index_name + '.tmp')
+    with open(tmp_file, 'w') as f: json.dump(entries, f)
+    os.replace(tmp_file, os.path.join(root, ckpt_index_name))
+    return entries
+
+def latest_indexed_ckpt(
+    root,                # run root directory with an index in it
+    run_name_prefix='',  # only consider runs whose names start with this
+    ):
+    "newest checkpoint listed in root's index that still exists, or None"
+    entries = [e for e in _read_ckpt_index(root) if e['run'].startswith(run_name_prefix)]
+    for e in sorted(entries, key=lambda e: e['time'], reverse=True):
+        if os.path.exists(os.path.join(root, e['path'])): return Path(root) / e['path']
+    return None
+
+def _ckpt_index_is_current(
+    root,                # run root directory
+    run_name_prefix='',  # only consider runs whose names start with this
+    ):
+    "False if root has no index, or if a checkpoints/ dir has changed since the index was last written"
+    index_file = os.path.join(root, ckpt_index_name)
+    if not os.path.exists(index_file): return False
+    index_time = os.path.getmtime(index_file)
+    # adding a checkpoint bumps its directory's mtime, so this catches new runs & unregistered saves without a full search
+    ckpt_dirs = set(glob.glob(os.path.join(glob.escape(str(root)), f'{run_name_prefix}*', 'checkpoints')))
+    ckpt_dirs |= {os.path.dirname(os.path.join(root, e['path'])) for e in _read_ckpt_index(root) 
+                  if e['run'].startswith(run_name_prefix)}
+    for d in ckpt_dirs:
+        try: 
+            if os.path.getmtime(d) > index_time: return False
+        except FileNotFoundError: pass
+    return True
+
+def find_ckpts(
+    root,                # directory tree to search
+    run_name_prefix='',  # only look in runs whose names start with this
+    max_depth=None,      # how many directory levels above the run directory to search. None = unlimited
+    ):
+    "bounded-depth version of Path(root).glob(f'**/{run_name_prefix}*/checkpoints/*.ckpt')"
+    pattern = f'{run_name_prefix}*/checkpoints/*.ckpt'
+    if max_depth is None: return list(Path(root).glob('**/' + pattern))
+    return [p for depth in range(max_depth + 1) for p in Path(root).glob('*/' * depth + pattern)]
+    
 def get_latest_ckpt(
     dir_tree,            # name of the run without unique identifer
     run_name_prefix='',  # unique identifier for particular run
     sim_ckpts=[''],       # string or list of strings. other paths to check under if nothing's in dir_tree
     verbose=True,        # whether to print message(s)
+    max_depth=None,      # how deep to search when there's no up-to-date checkpoint index. None = unlimited
     ):
     "This will grab the most recent checkpoint filename in dir tree given by name"
-    list_of_files = list(Path(dir_tree).glob(f'**/{run_name_prefix}*/checkpoints/*.ckpt'))
+    def check(directory):  # use the index if it's up to date, otherwise search
+        ckpt = latest_indexed_ckpt(directory, run_name_prefix) if _ckpt_index_is_current(directory, run_name_prefix) else None
+        return [ckpt] if ckpt is not None else find_ckpts(directory, run_name_prefix, max_depth=max_depth)
+    list_of_files = check(dir_tree)
     if [] != list_of_files: return max(list_of_files, key=os.path.getctime)
     print(f"   Nothing relevant found in {dir_tree}. Checking also in {sim_ckpts}.")
     if isinstance(sim_ckpts, str): sim_ckpts = [sim_ckpts]
@@ -206,12 +1238,12 @@ def get_latest_ckpt(
         if verbose: print("   Also checking in ",directories) 
         for directory in directories:
             if verbose: print("     directory = ",directory)
-            list_of_files += list(Path(directory).glob(f'**/{run_name_prefix}*/checkpoints/*.ckpt'))
+            list_of_files += check(directory)
     if [] != list_of_files: return max(list_of_files, key=os.path.getctime)
     warnings.warn("   No matching checkpoint files found anywhere. Starting run from scratch.") 
     return ""
 
-# %% ../00_core.ipynb 60
+# %% ../00_core.ipynb 118
 def rnd_string(n=8): 
     "random letters and numbers of given length. case sensitive"
     raise DeprecationWarning("Better to generate random string in SLURM script")
@@ -7,7 +7,6 @@ import torch
 import torch.nn as nn
 import torchaudio
 from torchaudio import transforms as T
-from torchvision import transforms as VT
 import random
 import os
 import json
@@ -15,13 +14,13 @@ import tqdm
 from multiprocessing import Pool, cpu_count
 from urllib.parse import urlparse
 from functools import partial
-from .core import load_audio, get_audio_filenames, is_silence, untuple
+from .core import load_audio, get_audio_filenames, is_silence, untuple, get_audio_info, get_audio_index, AudioCache, \
+    PackedCorpus, packed_to_float, WorkerRuntime
 from fastcore.utils import *
-import webdataset as wds
 import subprocess
 import re
-import pedalboard
 from typing import Tuple
+# webdataset & torchvision are imported inside the routines that use them, to keep imports quick
 
 # %% auto 0
 __all__ = ['pipeline_return', 'RandomGain', 'PadCrop', 'PadCrop_Normalized_T_old', 'PadCrop_Normalized_T', 'PhaseFlipper',
@@ -68,29 +67,50 @@ class PadCrop(nn.Module):
         randomize=True,      # draw cropped chunk from a random position in audio file
         redraw_silence=True, # a chunk containing silence will be replaced with a new one
         silence_thresh=-60,  # threshold in dB below which we declare to be silence
-        max_redraws=2        # when redrawing silences, don't do it more than this many
+        max_redraws=2,       # when redrawing silences, don't do it more than this many
+        sr=48000,            # sample rate, only used when signal is a filename to read a chunk from
         ):
         super().__init__()
         store_attr()     # sets self.___ vars automatically
+
+    def pick_start(self, s):
+        "where to start a chunk, given the signal length s"
+        return 0 if (not self.randomize) else torch.randint(0, max(0, s - self.n_samples) + 1, []).item()
     
     def draw_chunk(self, signal):
         "here's the part that actually draws a cropped/padded chunk of audio from signal"
-        if len(signal.shape) < 2: signal = torch.unsqueeze(signal,0)
+        if len(signal.shape) < 2: signal = signal[None]
         n, s = signal.shape
-        start = 0 if (not self.randomize) else torch.randint(0, max(0, s - self.n_samples) + 1, []).item()
+        start = self.pick_start(s)
         end = start + self.n_samples
-        chunk = signal.new_zeros([n, self.n_samples])
-        chunk[:, :min(s, self.n_samples)] = signal[:, start:end]
-        crop_range = torch.tensor([start,end],dtype=int).to(signal.device) # making this a tensor helps preserve order in DataLoader 
+        crop = signal[:, start:end]
+        if isinstance(crop, np.ndarray): crop = packed_to_float(crop)  # e.g. memmap from a PackedCorpus: only the crop gets read
+        chunk = crop.new_zeros([n, self.n_samples])
+        chunk[:, :min(s, self.n_samples)] = crop
+        crop_range = torch.tensor([start,end],dtype=int).to(crop.device) # making this a tensor helps preserve order in DataLoader 
         return chunk, crop_range
+
+    def draw_chunk_from_file(self, filename):
+        "like draw_chunk, but picks the start using only the file header, then decodes only that window"
+        info = get_audio_info(filename)
+        s = int(info['frames'] * self.sr / info['sr'])  # length of whole file at our sample rate
+        start = self.pick_start(s)
+        end = start + self.n_samples
+        signal = load_audio(filename, sr=self.sr, verbose=False, offset=start/self.sr, duration=self.n_samples/self.sr)
+        if len(signal.shape) < 2: signal = torch.unsqueeze(signal,0)
+        chunk = signal.new_zeros([signal.shape[0], self.n_samples])
+        n = min(signal.shape[-1], self.n_samples)   # resampling can give us a sample more or less than we asked for
+        chunk[:, :n] = signal[:, :n]
+        return chunk, torch.tensor([start,end],dtype=int)
     
     def __call__(self, x):
-        "when part of the pipline, this will grab a padded/cropped chunk from signal"
+        "when part of the pipline, this will grab a padded/cropped chunk from signal (or from a filename)"
         signal = x if not isinstance(x, dict) else x['inputs']
-        chunk, crop_range = self.draw_chunk(signal)
+        draw = self.draw_chunk_from_file if isinstance(signal, str) else self.draw_chunk
+        chunk, crop_range = draw(signal)
         num_redraws = 0
         while self.redraw_silence and is_silence(chunk, thresh=self.silence_thresh) and (num_redraws < self.max_redraws):
-            chunk, crop_range = self.draw_chunk(signal)
+            chunk, crop_range = draw(signal)
             num_redraws = num_redraws+1
         if not isinstance(x, dict):  # multiple values, not handled by pipeline_return
             return chunk
@@ -371,13 +391,19 @@ class AudioDataset(torch.utils.data.Dataset):
         max_redraws=2,        # when redrawing silences, don't do it more than this many
         augs='Stereo(), PhaseFlipper()', # list of augmentation transforms **after PadCrop**, as a string
         verbose=False,       # whether to print notices of reasampling or not
-        return_dict=False    # False=return raw audio only, True=return dict of all kinds of info
+        return_dict=False,   # False=return raw audio only, True=return dict of all kinds of info
+        windowed_load=False, # True = use file headers to pick crops, & only decode those windows (instead of whole files)
+        index_file=None,     # audio metadata index (.npz) to load instead of scanning paths. built & saved if it doesn't exist
+        scan_manifest=None,  # json file caching directory listings, so unchanged directories aren't re-listed. see core.scan_dirs
+        audio_cache=None,    # directory for an on-disk cache of decoded audio (or a core.AudioCache), shared across epochs & runs
+        packed_corpus=None,  # prefix of a corpus written by core.pack_corpus. if given, crops come straight from it & paths is ignored
+        runtime=None,        # core.WorkerRuntime for the processes (& their threads) that preload files. None = one single-threaded process per CPU
         ):
         super().__init__()
     
         print("augs =",augs)
         # base_augs are always applied
-        base_augs = 'PadCrop(sample_size, randomize=random_crop, redraw_silence=redraw_silence, silence_thresh=silence_thresh, max_redraws=max_redraws)'
+        base_augs = 'PadCrop(sample_size, randomize=random_crop, redraw_silence=redraw_silence, silence_thresh=silence_thresh, max_redraws=max_redraws, sr=sample_rate)'
         self.augs = eval(f'torch.nn.Sequential( {base_augs}, {augs} )')  if augs is not None else None 
         self.silence_thresh = silence_thresh
         self.redraw_silence = redraw_silence
@@ -386,17 +412,32 @@ class AudioDataset(torch.utils.data.Dataset):
         self.cache_training_data = cache_training_data
         self.verbose = verbose
         self.return_dict = return_dict
-
-        self.filenames = get_audio_filenames(paths)
+        self.windowed_load = windowed_load
+        self.audio_cache = AudioCache(audio_cache) if isinstance(audio_cache, str) else audio_cache
+        self.runtime = runtime if runtime is not None else WorkerRuntime()
+
+        self.packed = PackedCorpus(packed_corpus) if packed_corpus is not None else None
+        if self.packed is not None:
+            assert self.packed.sr == sample_rate, f"AudioDataset: packed corpus has sr={self.packed.sr}, not {sample_rate}"
+        self.index = get_audio_index(paths, index_file) if index_file is not None and self.packed is None else None
+        if self.packed is not None:  self.filenames = self.packed.paths
+        elif self.index is not None: self.filenames = self.index['path']
+        else: self.filenames = get_audio_filenames(paths, manifest_file=scan_manifest)
         print(f"AudioDataset:{len(self.filenames)} files found.")
         self.n_files = int(len(self.filenames)*load_frac)
         self.filenames = self.filenames[0:self.n_files]
         if cache_training_data: self.preload_files()
 
+        from torchvision import transforms as VT
         self.convert_tensor = VT.ToTensor()
 
+    def load_file(self, filename): 
+        "decode a whole file, via the disk cache if there is one"
+        if self.audio_cache is not None: return self.audio_cache(filename, sr=self.sr, verbose=self.verbose)
+        return load_audio(filename, sr=self.sr, verbose=self.verbose)
+
     def load_file_ind(self, file_list,i): # used when caching training data
-        return load_audio(file_list[i], sr=self.sr, verbose=self.verbose).cpu()
+        return self.load_file(file_list[i]).cpu()
 
     def get_data_range(self): # for parallel runs, only grab part of the data -- OBVIATED BY CHUNKING.
         start, stop = 0, len(self.filenames)
@@ -414,7 +455,7 @@ class AudioDataset(torch.utils.data.Dataset):
         print(f"Caching {self.n_files} input audio files:")
         wrapper = partial(self.load_file_ind, self.filenames)
         start, stop = self.get_data_range()
-        with Pool(processes=cpu_count()) as p:   # //8 to avoid FS bottleneck and/or too many processes (b/c * num_gpus)
+        with Pool(processes=self.runtime.workers, initializer=self.runtime.setup) as p:   # fewer workers to avoid FS bottleneck and/or too many processes (b/c * num_gpus)
             self.audio_files = list(tqdm.tqdm(p.imap(wrapper, range(start,stop)), total=stop-start))
 
     def __len__(self):
@@ -429,8 +470,12 @@ class AudioDataset(torch.utils.data.Dataset):
         try:
             if self.cache_training_data:
                 audio = self.audio_files[idx] # .copy()
+            elif self.packed is not None:
+                audio = self.packed[idx]      # memmap view, PadCrop will read just the chunk it needs
+            elif self.windowed_load and self.audio_cache is None:
+                audio = audio_filename        # PadCrop will read just the chunk it needs
             else:
-                audio = load_audio(audio_filename, sr=self.sr, verbose=self.verbose)
+                audio = self.load_file(audio_filename)
             x = {'filename':audio_filename, 'inputs':audio} if self.return_dict else audio  # x is either audio or dict
             x = self.augs(x)      # RUN AUGMENTATION PIPELINE
             if isinstance(x, dict):
@@ -798,6 +843,7 @@ def log_and_continue(exn):
     """Call in an exception handler to ignore any exception, isssue a warning, and continue. 
     source: audio-diffusion repo"""
     print(f"Handling webdataset error ({repr(exn)}). Ignoring.")
+    import webdataset as wds
     rank, world_size, worker, num_workers = wds.utils.pytorch_worker_info()
     print(f"Rank: {rank}, worker: {worker}")
     return True
@@ -836,6 +882,7 @@ def AudioWebDataLoader(
     **kwargs,                # what else to pass to callback
     ):
     "Sets up a WebDataLoader pipeline with some typical defaults for audio files"
+    import webdataset as wds
     if verbose:
         print("AudioWebDataLoader: Note: 'Broken pipe' messages you might get aren't a big deal, but may indicate files that are too big.")
         print("AudioWebDataLoader: ", ', '.join(['{}={!r}'.format(k, v) for k, v in locals().items()]))
@@ -884,6 +931,7 @@ def get_wds_loader(batch_size, sample_size, names, s3_url_prefix=None, sample_ra
                    recursive=True, profiles={}, epoch_steps=1000, random_crop=True, normalize_lufs=None, 
                    metadata_prompt_funcs=None, force_channels="stereo", augment_phase=True):
     "Simpler loader from https://github.com/zqevans/audio-diffusion/dataset.py"
+    import webdataset as wds
     
     preprocess_fn = partial(wds_preprocess, sample_size=sample_size, sample_rate=sample_rate, random_crop=random_crop, normalize_lufs=normalize_lufs, metadata_prompt_funcs=metadata_prompt_funcs, force_channels=force_channels, augment_phase=augment_phase)
 
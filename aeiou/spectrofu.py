@@ -11,31 +11,40 @@ import os
 import math
 from multiprocessing import Pool, cpu_count, Barrier
 from functools import partial
-from tqdm.contrib.concurrent import process_map  
+import time
 import torch
 import torchaudio
-from .core import is_silence, load_audio, makedir, get_audio_filenames
+from .core import is_silence, load_audio, makedir, get_shared_audio_index, iter_audio_filenames, stream_map, size_batches, index_durations, \
+    shard_spec, hash_shard, balanced_shard, shard_filename, stage_stats, PipelineReport, WorkerRuntime, \
+    merge_report_files
 from .viz import audio_spectrogram_image
 
 # %% ../04_spectrofu.ipynb 7
 def save_stft(
     audio:torch.tensor,  # long audio file to be chunked
-    new_filename:str    # stem of new filename(s) to be output as spectrogram images
+    new_filename:str,   # stem of new filename(s) to be output as spectrogram images
+    fast=False,         # draw the image directly (viz.fast_spectrogram_image) instead of via matplotlib
+    size=(384, 384),    # (width, height) of the image, when fast=True. matplotlib's is always 384x384
     ):
     "coverts audio to stft image and saves it"
-    im = audio_spectrogram_image(audio, justimage=True)  # should already be a PIL image
+    with stage_stats.time('spectrogram'):
+        im = audio_spectrogram_image(audio, justimage=True, fast=fast, size=size)  # should already be a PIL image
     print(f"saving new file = {new_filename}")
-    im.save(new_filename)
+    with stage_stats.time('write') as counts:
+        im.save(new_filename)
+        counts['written'] = os.path.getsize(new_filename)
     return
 
 # %% ../04_spectrofu.ipynb 8
 def process_one_file(
     filenames:list,      # list of filenames from which we'll pick one
     args,                # output of argparse
-    file_ind             # index from filenames list to read from
+    file_ind             # index from filenames list to read from, or the filename itself (then filenames can be None)
     ):
-    "this turns one audio file into a spectrogram.  left channel only for now"
-    filename = filenames[file_ind]  # this is actually input_path+/+filename
+    "this turns one audio file into a spectrogram.  left channel only for now. Returns timing stats, or None on failure"
+    stage_stats.pop()   # start this file's per-stage timings from zero
+    start = time.perf_counter()
+    filename = file_ind if isinstance(file_ind, str) else filenames[file_ind]  # this is actually input_path+/+filename
     output_path, input_paths = args.output_path, args.input_paths
     new_filename = None
     
@@ -54,30 +63,62 @@ def process_one_file(
 
     try:
         audio = load_audio(filename, sr=args.sr)
-        save_stft(audio, new_filename)
+        save_stft(audio, new_filename, fast=(args.renderer == 'fast'), size=args.image_size)
     except Exception as e: 
         print(f"Some kind of error happened with {filename}, either loading or writing images. Skipping.", flush=True)
+        return
 
-    return
+    return {'path': filename, 'secs': time.perf_counter() - start, 'stages': stage_stats.pop()}
 
 
 def main():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--sr', type=int, default=48000, help='Output sample rate')
-    parser.add_argument('--workers', type=int, default=min(32, os.cpu_count() + 4), help='Maximum number of workers to use (default: all)')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes. Default: as many as fit on the available CPUs, given --threads')
+    parser.add_argument('--threads', type=int, default=None, help='torch/OpenMP/MKL threads per worker. Default: share the CPUs out evenly between --workers, or 1 if --workers is not given either')
+    parser.add_argument('--pin_cpus', action='store_true', help='Pin each worker to its own block of --threads CPUs (Linux only)')
+    parser.add_argument('--batch_secs', type=float, default=600, help='(with --index) Files shorter than this get sent to workers in batches of about this many seconds of audio')
+    parser.add_argument('--shard_index', type=int, default=None, help='Which of the --num_shards shards of the inputs to process. Default: from $SLURM_ARRAY_TASK_ID, else 0')
+    parser.add_argument('--num_shards', type=int, default=None, help='Split the inputs into this many shards, e.g. one per node. Default: $SLURM_ARRAY_TASK_COUNT, else 1')
+    parser.add_argument('--index', default='', help='Audio metadata index file (.npz). Loaded instead of scanning input_paths if it exists, otherwise built & saved')
+    parser.add_argument('--renderer', default='matplotlib', choices=['matplotlib', 'fast'], help="How to draw spectrograms. 'fast' skips matplotlib & maps dB through a colormap lookup table: many times quicker, nearly identical images")
+    parser.add_argument('--image_size', type=int, nargs=2, default=[384, 384], metavar=('WIDTH', 'HEIGHT'), help="Size of spectrogram images, with --renderer fast")
+    parser.add_argument('--merge', action='store_true', help="Merge the per-shard stats in output_path (after all shards are done) and exit")
+    parser.add_argument('--report', default='', help='Also save the throughput report (per-stage and per-file timings) to this .json or .csv file')
     parser.add_argument('output_path', help='Path of output for spectrogram-ified data')
-    parser.add_argument('input_paths', nargs='+', help='Path(s) of a file or a folder of files. (recursive)')
+    parser.add_argument('input_paths', nargs='*', help='Path(s) of a file or a folder of files. (recursive)')
     args = parser.parse_args()
+    stats_main = f'{args.output_path}/spectrofu_stats.json'
+    if args.merge:
+        print("spectrofu: merged stats =", merge_report_files(stats_main))
+        return
+    if not args.input_paths: parser.error("need at least one input path")
 
     print(f"  output_path = {args.output_path}")
+    shard_index, num_shards = shard_spec(args.shard_index, args.num_shards)
+    runtime = WorkerRuntime(args.workers, args.threads, pin=args.pin_cpus)  # workers x threads, so torch doesn't oversubscribe the CPUs
+    print(f"  {runtime}")
 
-    print("Getting list of input filenames")
-    filenames = get_audio_filenames(args.input_paths) 
-    n = len(filenames)   
-    print(f"  Got {n} input filenames") 
+    if args.index:  # we know the whole list up front
+        index = get_shared_audio_index(args.input_paths, args.index, shard_index, num_shards)   # built once, by shard 0
+        filenames, durations = index['path'], dict(zip(index['path'], index_durations(index)))
+        if num_shards > 1: filenames = balanced_shard(filenames, index_durations(index), shard_index, num_shards)
+        total = len(filenames)
+        print(f"  Got {total} input filenames") 
+        jobs = size_batches(filenames, [durations[f] for f in filenames], min_batch=args.batch_secs)  # longest first, short ones batched
+    else:           # start processing while we're still scanning
+        jobs, total = hash_shard(iter_audio_filenames(args.input_paths), shard_index, num_shards), None
 
     print("Processing files (in parallel)")
-    wrapper = partial(process_one_file, filenames, args)
-    r = process_map(wrapper, range(0, n), chunksize=1, max_workers=args.workers)  # different chunksize used by tqdm. max_workers is to avoid annoying other ppl
+    report = PipelineReport()
+    def tally(r): 
+        if r is None: report.add(failed=1)
+        else: report.add_file(**r)
+    wrapper = partial(process_one_file, None, args)
+    stream_map(wrapper, jobs, runtime=runtime, total=total, unit='file', callback=tally, batched=bool(args.index), keep_results=False)  # --workers is to avoid annoying other ppl
 
     print("Finished")
+    print(report.summary())
+    makedir(args.output_path)
+    report.save(shard_filename(stats_main, shard_index, num_shards))   # for --merge to combine, when there are several shards
+    if args.report: report.save(shard_filename(args.report, shard_index, num_shards))
@@ -2,19 +2,16 @@
 
 # %% auto 0
 __all__ = ['plotly_already_setup', 'embeddings_table', 'project_down', 'proj_pca', 'point_cloud', 'pca_point_cloud', 'on_colab',
-           'setup_plotly', 'show_point_cloud', 'show_pca_point_cloud', 'print_stats', 'mel_spectrogram',
-           'spectrogram_image', 'audio_spectrogram_image', 'generate_melspec', 'playable_spectrogram',
-           'tokens_spectrogram_image', 'plot_jukebox_embeddings']
+           'setup_plotly', 'show_point_cloud', 'show_pca_point_cloud', 'print_stats', 'get_mel_op', 'mel_spectrogram',
+           'batch_mel_spectrogram', 'spectrogram_image', 'colormap_lut', 'fast_spectrogram_image',
+           'audio_spectrogram_image', 'generate_melspec', 'playable_spectrogram', 'tokens_spectrogram_image',
+           'plot_jukebox_embeddings']
 
 # %% ../02_viz.ipynb 5
 import math
 import os
+from functools import lru_cache
 from pathlib import Path
-from matplotlib.backends.backend_agg import FigureCanvasAgg
-import matplotlib.cm as cm
-import matplotlib.pyplot as plt 
-from matplotlib.colors import Normalize
-from matplotlib.figure import Figure
 import numpy as np
 from PIL import Image
 
@@ -23,29 +20,19 @@ from torch import optim, nn
 from torch.nn import functional as F
 import torchaudio
 import torchaudio.transforms as T
-from librosa import power_to_db
 from einops import rearrange
 
-import wandb
-import numpy as np
-from pandas import DataFrame
-import umap
-
-from IPython.display import display, HTML  # just for displaying inside notebooks
-
 from .core import load_audio
 
-# for playable spectrograms:
-import plotly.graph_objects as go
-import holoviews as hv 
-import panel as pn
-from bokeh.resources import INLINE
-from scipy.signal import spectrogram
+# NOTE: heavier dependencies -- wandb, pandas, umap, IPython, plotly, holoviews, panel, bokeh, scipy, librosa & matplotlib -- 
+# are imported inside the routines that use them, so that `import aeiou.viz` (e.g. by spectrofu) stays quick
 #from bokeh.io import output_notebook
 
 # %% ../02_viz.ipynb 6
 def embeddings_table(tokens):
     "make a table of embeddings for use with wandb"
+    import wandb
+    from pandas import DataFrame
     features, labels = [], []
     embeddings = rearrange(tokens, 'b d n -> b n d') # each demo sample is n vectors in d-dim space
     for i in range(embeddings.size()[0]):  # nested for's are slow but sure ;-) 
@@ -74,6 +61,7 @@ def project_down(tokens,     # batched high-dimensional data with dims (b,d,n)
     A = rearrange(tokens, 'b d n -> (b n) d') # put all the vectors into the same d-dim space
     if A.shape[-1] > proj_dims: 
         if method=='umap':
+            import umap
             proj_data = umap.UMAP(n_components=proj_dims, n_neighbors=n_neighbors, min_dist=min_dist,
                             metric='correlation', **kwargs).fit_transform(A.cpu().numpy())
             proj_data = torch.from_numpy(proj_data).to(tokens.device)
@@ -107,6 +95,8 @@ def point_cloud(
     **kwargs,             # anything else to pass along
     ):
     "returns a 3D point cloud of the tokens" 
+    import matplotlib.cm as cm
+    from matplotlib.colors import Normalize
     if ds_preproj != 1: 
         tokens = tokens[torch.randperm(tokens.size()[0])]  # EXPERIMENTAL: to 'correct' for possible weird effects of downsampling
         tokens = tokens[::ds_preproj]
@@ -149,6 +139,7 @@ def point_cloud(
     if output_type == 'points':
         return point_cloud
     elif output_type =='plotly':
+        import plotly.graph_objects as go
         fig = go.Figure(data=[go.Scatter3d(
             x=point_cloud[::ds_preplot,0], y=point_cloud[::ds_preplot,1], z=point_cloud[::ds_preplot,2], 
             marker=dict(size=size,  color=point_cloud[:,3:6]),
@@ -168,6 +159,7 @@ def point_cloud(
         if debug: print("point_cloud: fig made. returning")
         return fig
     else:
+        import wandb
         return wandb.Object3D(point_cloud)
     
     
@@ -199,6 +191,7 @@ def setup_plotly(nbdev=True):
     if plotly_already_setup: return 
     if nbdev and not on_colab():  # Nick Burrus' code for normal-Juptyer use with plotly & nbdev
         import plotly.io as pio
+        from IPython.display import display, HTML  # just for displaying inside notebooks
         pio.renderers.default = 'notebook_connected'
         js = '<script src="https://cdnjs.cloudflare.com/ajax/libs/require.js/2.3.6/require.min.js" integrity="sha512-c3Nl8+7g4LMSTdrm621y7kf9v3SDPnhxLNhcjFJbKECVnmZHTdo+IRO05sNLTH/D3vA6u1X32ehoLC7WFVdheg==" crossorigin="anonymous"></script>'
         display(HTML(js))
@@ -249,26 +242,53 @@ def print_stats(waveform, sample_rate=None, src=None, print=print):
     print('')
 
 # %% ../02_viz.ipynb 25
-def mel_spectrogram(waveform, power=2.0, sample_rate=48000, db=False, n_fft=1024, n_mels=128, debug=False):
-    "calculates data array for mel spectrogram (in however many channels)"
-    win_length = None
-    hop_length = n_fft//2 # 512
-
-    mel_spectrogram_op = T.MelSpectrogram(
+def get_mel_op(sample_rate=48000, n_fft=1024, n_mels=128, power=2.0, win_length=None, hop_length=None, device='cpu'):
+    """a T.MelSpectrogram for these parameters, built once & then reused: making one computes its window and
+    mel filterbank. Shared by mel_spectrogram, batch_mel_spectrogram, generate_melspec (& so spectrofu), so don't modify it"""
+    hop_length = n_fft//2 if hop_length is None else hop_length   # normalized, so equivalent calls share one entry
+    return _mel_op(sample_rate, n_fft, n_mels, power, win_length, hop_length, str(device))
+
+@lru_cache(maxsize=32)
+def _mel_op(sample_rate, n_fft, n_mels, power, win_length, hop_length, device):
+    return T.MelSpectrogram(
         sample_rate=sample_rate, n_fft=n_fft, win_length=win_length, 
         hop_length=hop_length, center=True, pad_mode="reflect", power=power, 
-        norm='slaney', onesided=True, n_mels=n_mels, mel_scale="htk")
+        norm='slaney', onesided=True, n_mels=n_mels, mel_scale="htk").to(device)
+
+_amp_to_db_op = T.AmplitudeToDB()  # no parameters to build, but no need to make a new one each call either
 
+def mel_spectrogram(waveform, power=2.0, sample_rate=48000, db=False, n_fft=1024, n_mels=128, debug=False):
+    "calculates data array for mel spectrogram (in however many channels)"
+    mel_spectrogram_op = get_mel_op(sample_rate=sample_rate, n_fft=n_fft, n_mels=n_mels, power=power, device=str(waveform.device))
     melspec = mel_spectrogram_op(waveform.float())
     if db: 
-        amp_to_db_op = T.AmplitudeToDB()
-        melspec = amp_to_db_op(melspec)
+        melspec = _amp_to_db_op(melspec)
     if debug:
         print_stats(melspec, print=print) 
         print(f"torch.max(melspec) = {torch.max(melspec)}")
         print(f"melspec.shape = {melspec.shape}")
     return melspec
 
+def batch_mel_spectrogram(
+    clips,              # list of audio tensors, (c, n) or (n), of any lengths & numbers of channels. or one tensor (b, c, n)
+    power=2.0, sample_rate=48000, db=False, n_fft=1024, n_mels=128, hop_length=None, # as for mel_spectrogram
+    max_rows=16,        # most channels to put through one STFT call. bounds memory use; bigger batches help most with more threads, or on GPU
+    ) -> list:
+    """mel spectrograms of many clips (and all their channels) at once: clips of the same length go through the
+    same STFT call (in groups of max_rows), e.g. all the chunks from chunkadelic at once. Returns a list of (c, n_mels, frames) (or, for (n) clips, 
+    (n_mels, frames)) tensors, the same as calling mel_spectrogram on each clip would"""
+    if torch.is_tensor(clips): clips = list(clips)
+    out, by_len = [None]*len(clips), {}
+    for i, clip in enumerate(clips): by_len.setdefault(clip.shape[-1], []).append(i)
+    for inds in by_len.values():   # every channel of every clip of this length, stacked
+        rows = torch.cat([clips[i].reshape(-1, clips[i].shape[-1]) for i in inds]).float()
+        op = get_mel_op(sample_rate=sample_rate, n_fft=n_fft, n_mels=n_mels, power=power, hop_length=hop_length, device=str(rows.device))
+        mels = torch.cat([op(r) for r in rows.split(max_rows)])
+        if db: mels = _amp_to_db_op(mels)
+        mels = mels.split([clips[i].reshape(-1, clips[i].shape[-1]).shape[0] for i in inds])
+        for i, m in zip(inds, mels): out[i] = m.reshape(*clips[i].shape[:-1], *m.shape[-2:])
+    return out
+
 # %% ../02_viz.ipynb 26
 def spectrogram_image(
         spec, 
@@ -281,6 +301,10 @@ def spectrogram_image(
         figsize=(5, 4), # size of plot (if justimage==False)
     ):
     "Modified from PyTorch tutorial https://pytorch.org/tutorials/beginner/audio_feature_extractions_tutorial.html"
+    import matplotlib.pyplot as plt
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from librosa import power_to_db
     fig = Figure(figsize=figsize, dpi=100) if not justimage else Figure(figsize=(4.145, 4.145), dpi=100, tight_layout=True)
     canvas = FigureCanvasAgg(fig)
     axs = fig.add_subplot()
@@ -305,11 +329,44 @@ def spectrogram_image(
         #print(f"im.size = {im.size}")
     return im
 
+def colormap_lut(cmap='viridis', n=256):
+    "(n,3) uint8 RGB lookup table for a matplotlib colormap"
+    return _colormap_lut(cmap, n).copy()
+
+@lru_cache(maxsize=None)
+def _colormap_lut(cmap, n):
+    from matplotlib import colormaps
+    return (colormaps[cmap](np.linspace(0, 1, n))[:, :3] * 255 + 0.5).astype(np.uint8)
+
+def fast_spectrogram_image(
+        spec,               # power spectrogram, (freq, time). extra leading dims of size 1 are squeezed out
+        size=(384, 384),    # (width, height) in pixels of the image returned
+        db_range=[35,120],  # dB values mapped to the bottom & top of the colormap
+        cmap='viridis',     # matplotlib colormap name
+        resample='bilinear',# how to stretch the spectrogram to `size`: 'bilinear' or 'nearest'
+    ):
+    """Like spectrogram_image(justimage=True), but maps dB values straight through a colormap lookup table
+    instead of drawing a matplotlib figure: much faster, no border to crop, and exactly `size` pixels.
+    Returns a palette ('P' mode) image, which is also quicker to save as PNG; .convert('RGB') it if you need RGB"""
+    spec = torch.as_tensor(spec).squeeze().float()
+    # dB as in librosa's power_to_db (used by spectrogram_image): 10*log10, floored at 1e-10 and at 80 dB below the max
+    x = spec.clamp(min=max(1e-10, spec.max().item()*1e-8)).log10_().mul_(10)
+    x = x.sub_(db_range[0]).div_(db_range[1] - db_range[0]).clamp_(0, 1).flip(0)  # low frequencies at the bottom
+    im = Image.fromarray(x.cpu().numpy(), mode='F')
+    im = im.resize(tuple(size), resample=Image.BILINEAR if resample == 'bilinear' else Image.NEAREST)
+    im = Image.fromarray((np.asarray(im) * 255 + 0.5).astype(np.uint8), mode='L')
+    im.putpalette(_colormap_lut(cmap, 256).tobytes())  # makes it a 'P' image
+    return im
+
 # %% ../02_viz.ipynb 27
-def audio_spectrogram_image(waveform, power=2.0, sample_rate=48000, print=print, db=False, db_range=[35,120], justimage=False, log=False, figsize=(5, 4)):
-    "Wrapper for calling above two routines at once, does Mel scale; Modified from PyTorch tutorial https://pytorch.org/tutorials/beginner/audio_feature_extractions_tutorial.html"
+def audio_spectrogram_image(waveform, power=2.0, sample_rate=48000, print=print, db=False, db_range=[35,120], justimage=False, log=False, figsize=(5, 4),
+                            fast=False, size=(384, 384)):
+    """Wrapper for calling above two routines at once, does Mel scale; Modified from PyTorch tutorial https://pytorch.org/tutorials/beginner/audio_feature_extractions_tutorial.html
+    fast=True draws just the image, of `size` (width, height) pixels, via fast_spectrogram_image instead of matplotlib"""
+    if waveform.ndim > 1: waveform = waveform[:1]  # TODO: only left channel for now, so don't bother computing the others
     melspec = mel_spectrogram(waveform, power=power, db=db, sample_rate=sample_rate, debug=log)
-    melspec = melspec[0] # TODO: only left channel for now
+    melspec = melspec[0]
+    if fast: return fast_spectrogram_image(melspec, size=size, db_range=db_range)
     return spectrogram_image(melspec, title="MelSpectrogram", ylabel='mel bins (log freq)', db_range=db_range, justimage=justimage, figsize=figsize)
 
 # %% ../02_viz.ipynb 31
@@ -321,25 +378,15 @@ def audio_spectrogram_image(waveform, power=2.0, sample_rate=48000, print=print,
 # helper routine; a bit redundant given what else is in this repo
 def generate_melspec(audio_data, sample_rate=48000, power=2.0, n_fft = 1024, win_length = None, hop_length = None, n_mels = 128):
     "helper routine for playable_spectrogram"
+    from librosa import power_to_db
     if hop_length is None:
          hop_length = n_fft//2
 
     # convert to torch
     audio_data = torch.tensor(audio_data, dtype=torch.float32)
 
-    mel_spectrogram_op = T.MelSpectrogram(
-        sample_rate=sample_rate,
-        n_fft=n_fft,
-        win_length=win_length,
-        hop_length=hop_length,
-        center=True,
-        pad_mode="reflect",
-        power=power,
-        norm="slaney",
-        onesided=True,
-        n_mels=n_mels,
-        mel_scale="htk",
-    )
+    mel_spectrogram_op = get_mel_op(sample_rate=sample_rate, n_fft=n_fft, n_mels=n_mels, power=power, 
+                                    win_length=win_length, hop_length=hop_length)
 
     melspec = mel_spectrogram_op(audio_data).numpy()
     mel_db = np.flipud(power_to_db(melspec))
@@ -370,6 +417,10 @@ def playable_spectrogram(
       
       Limitations: spectrograms show channel 0 only (i.e., mono)
     '''
+    import wandb
+    import holoviews as hv 
+    import panel as pn
+    from scipy.signal import spectrogram
     hv.extension("bokeh", logo=False)
     
     audio_data = waveform.cpu().numpy()
@@ -451,7 +502,6 @@ def playable_spectrogram(
     return wandb.Html(html_file_name) if output_type=='wandb' else html_file_name
 
 # %% ../02_viz.ipynb 35
-from matplotlib.ticker import AutoLocator 
 def tokens_spectrogram_image(
         tokens,                # the embeddings themselves (in some diffusion codes these are called 'tokens')
         aspect='auto',         # aspect ratio of plot
@@ -465,6 +515,8 @@ def tokens_spectrogram_image(
         debug=False,           # print debugging info
     ):
     "for visualizing embeddings in a spectrogram-like way"
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
     batch_size, dim, samples = tokens.shape
     embeddings = rearrange(tokens, 'b d n -> (b n) d')  # expand batches in time
     vmin, vmax = None, None
@@ -498,6 +550,7 @@ def tokens_spectrogram_image(
 # %% ../02_viz.ipynb 39
 def plot_jukebox_embeddings(zs, aspect='auto'):
     "makes a plot of jukebox embeddings"
+    import matplotlib.pyplot as plt
     fig, ax = plt.subplots(nrows=len(zs))
     for i, z in enumerate(zs):
         #z = torch.squeeze(z)